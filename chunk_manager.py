@@ -6,6 +6,8 @@ import sqlite3
 from typing import Dict, Any
 import cohere
 
+from fast_json import dumps, loads
+
 # The 6 axial neighbor directions (pointy-top hex)
 HEX_NEIGHBORS = [
     ("q+1,r+0", 1, 0),
@@ -16,6 +18,77 @@ HEX_NEIGHBORS = [
     ("q+0,r+1", 0, 1),
 ]
 
+# Sites and their entities live in their own tables (keyed by chunk, location
+# and site name), so a site action rewrites one small row instead of the whole
+# chunk blob. chunks.data_json keeps the location-level fields only.
+# Sites are read back in rowid order (their order in the chunk), so an existing
+# site is upserted in place: INSERT OR REPLACE would delete and re-add it with a
+# new rowid, moving it to the end.
+SQL_INSERT_SITE = """
+    INSERT INTO sites (q, r, location_name, site_name, discovered, description, data_json)
+    VALUES (?,?,?,?,?,?,?)
+    ON CONFLICT (q, r, location_name, site_name) DO UPDATE SET
+        discovered=excluded.discovered, description=excluded.description, data_json=excluded.data_json
+"""
+SQL_INSERT_ENTITY = """
+    INSERT OR REPLACE INTO entities (q, r, location_name, site_name, idx, entity_json)
+    VALUES (?,?,?,?,?,?)
+"""
+
+# Site fields stored in their own columns/table rather than in sites.data_json
+SITE_COLUMNS = ("discovered", "description", "entities")
+
+
+def site_row(q: int, r: int, location_name: str, site_name: str, site: Dict[str, Any]) -> tuple:
+    """Build the sites row for one site dict (entities go in entity_rows)."""
+    extras = {k: v for k, v in site.items() if k not in SITE_COLUMNS}
+    return (q, r, location_name, site_name,
+            site.get("discovered"), site.get("description"), dumps(extras))
+
+
+def entity_rows(q: int, r: int, location_name: str, site_name: str, entities: list, start: int = 0) -> list:
+    """Build the entities rows for a site's entity list, numbered from start."""
+    return [(q, r, location_name, site_name, i, dumps(ent))
+            for i, ent in enumerate(entities, start)]
+
+
+def strip_sites(chunk_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a shallow copy of a chunk without the per-location "sites" dicts."""
+    return {
+        **chunk_data,
+        "locations": {
+            ln: {k: v for k, v in loc.items() if k != "sites"}
+            for ln, loc in chunk_data.get("locations", {}).items()
+        },
+    }
+
+
+def chunk_rows(q: int, r: int, chunk_data: Dict[str, Any]) -> tuple:
+    """
+    Serialize a chunk into the rows store_chunk_rows inserts: (chunks row, sites
+    rows, entities rows). A chunk that is stored more than once (the starting
+    chunk) can be serialized once and reused.
+    """
+    sites, ents = [], []
+    for ln, loc in chunk_data.get("locations", {}).items():
+        for sn, site in loc.get("sites", {}).items():
+            sites.append(site_row(q, r, ln, sn, site))
+            ents.extend(entity_rows(q, r, ln, sn, site.get("entities", [])))
+    return (q, r, dumps(strip_sites(chunk_data))), sites, ents
+
+
+def store_chunk_rows(cur: sqlite3.Cursor, rows: tuple):
+    """Insert a chunk already serialized by chunk_rows."""
+    chunk, sites, ents = rows
+    cur.execute("INSERT INTO chunks (q, r, data_json) VALUES (?,?,?)", chunk)
+    cur.executemany(SQL_INSERT_SITE, sites)
+    cur.executemany(SQL_INSERT_ENTITY, ents)
+
+
+def store_chunk(cur: sqlite3.Cursor, q: int, r: int, chunk_data: Dict[str, Any]):
+    """Insert a new chunk: location data into chunks, its sites into sites/entities."""
+    store_chunk_rows(cur, chunk_rows(q, r, chunk_data))
+
 class ChunkManager:
     """
     Creates new chunks with your 6-step procedure:
@@ -59,7 +132,7 @@ class ChunkManager:
         c = self.db.cursor()
         row = c.execute("SELECT data_json FROM chunks WHERE q=? AND r=?", (q, r)).fetchone()
         if row:
-            chunk_data = json.loads(row["data_json"])
+            chunk_data = loads(row["data_json"])
             print(f"[DEBUG] Found existing chunk at ({q},{r}) with {len(chunk_data.get('locations', {}))} locations")
             print(f"[DEBUG] Locations: {list(chunk_data.get('locations', {}).keys())}")
             print(f"[DEBUG] Connections: {[(loc, data.get('connections', [])) for loc, data in chunk_data.get('locations', {}).items()]}")
@@ -125,10 +198,7 @@ class ChunkManager:
         final_chunk = self._generate_ai_descriptions(q, r, chunk_data)
 
         # Store in DB
-        c.execute(
-            "INSERT INTO chunks (q, r, data_json) VALUES (?,?,?)",
-            (q, r, json.dumps(final_chunk))
-        )
+        store_chunk(c, q, r, final_chunk)
         self.db.commit()
 
         return final_chunk
@@ -163,7 +233,7 @@ class ChunkManager:
             if row:
                 try:
                     # row is a tuple, get first element
-                    chunk_data = json.loads(row[0])
+                    chunk_data = loads(row[0])
                     neighbors[dir_str] = chunk_data
                     print(f"[DEBUG] Successfully loaded neighbor from DB with {len(chunk_data.get('locations', {}))} locations")
                     # Print any locations that point to us
@@ -221,7 +291,7 @@ class ChunkManager:
                     row = c.execute("SELECT data_json FROM chunks WHERE q=? AND r=?", 
                                   (nbr_q, nbr_r)).fetchone()
                     if row:
-                        neighbor_data = json.loads(row[0])
+                        neighbor_data = loads(row[0])
                         print(f"[DEBUG] Successfully loaded neighbor from DB with {len(neighbor_data.get('locations', {}))} locations")
                     else:
                         print(f"[DEBUG] No neighbor found in DB at ({nbr_q},{nbr_r})")
@@ -0,0 +1,45 @@
+# cohere_client.py
+
+import threading
+
+import cohere
+import httpx
+from cohere_secrets import COHERE_API_KEY
+
+try:
+    import h2  # noqa: F401  (httpx's optional HTTP/2 support)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# A single pooled HTTP client underneath every Cohere call. Embeds (LoreRAG)
+# and chats (GameEngine and its managers) run back-to-back on most requests,
+# so sharing the pool lets them reuse the same keep-alive TCP + TLS session
+# instead of each client doing its own handshake. With h2 installed the
+# connections speak HTTP/2, so concurrent calls (e.g. NPCManager.ask_npcs)
+# are multiplexed over them rather than opening more sockets.
+#
+# Both are created on first use rather than at import, so tools that import
+# the game modules without talking to Cohere (reset_game, view_db, tests)
+# don't pay for building the client.
+_HTTP = None
+_COHERE = None
+_lock = threading.Lock()
+
+
+def get_client() -> cohere.ClientV2:
+    """Return the process-wide Cohere client shared by the engine and RAG."""
+    global _HTTP, _COHERE
+    if _COHERE is None:
+        with _lock:
+            if _COHERE is None:
+                # The transport retries failed connects (not failed requests),
+                # so a dropped keep-alive connection doesn't surface as an error
+                transport = httpx.HTTPTransport(
+                    http2=_HTTP2,
+                    retries=3,
+                    limits=httpx.Limits(max_keepalive_connections=20, max_connections=20),
+                )
+                _HTTP = httpx.Client(transport=transport, timeout=30.0)
+                _COHERE = cohere.ClientV2(api_key=COHERE_API_KEY, httpx_client=_HTTP)
+    return _COHERE
@@ -0,0 +1,16 @@
+# db_utils.py
+
+"""
+SQLite helpers shared by the reset script and the game engine.
+"""
+
+def apply_pragmas(db, cache_kib=20000):
+    """
+    Per-connection SQLite settings: WAL journaling with synchronous=NORMAL
+    (commits append to the WAL instead of fsyncing the main file, and readers
+    don't block the writer), temp tables in memory, and a cache of cache_kib KiB.
+    """
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA temp_store=MEMORY")
+    db.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
@@ -0,0 +1,31 @@
+# fast_json.py
+
+"""
+JSON helpers backed by orjson when it is installed, falling back to the
+stdlib json module otherwise. dumps() always returns str so the result can be
+stored in the existing TEXT columns either way.
+"""
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError / ValueError
+    JSONDecodeError = orjson.JSONDecodeError
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    import json
+
+    JSONDecodeError = json.JSONDecodeError
+    loads = json.loads
+    dumps = json.dumps
+
+
+def loads_list(raw):
+    """Parse a JSON list column, treating NULL / empty as an empty list."""
+    return loads(raw) if raw else []
@@ -1,16 +1,94 @@
 # game_engine.py
 
+import queue
 import sqlite3
+import threading
 import cohere
 from typing import Dict, Any, List, Optional
 from cohere_secrets import COHERE_API_KEY
+from cohere_client import get_client
 from lore_rag import LoreRAG
+from db_utils import apply_pragmas
+from fast_json import dumps, loads, loads_list, JSONDecodeError
 
 from chunk_manager import ChunkManager
 from location_manager import LocationManager
 from site_manager import SiteManager
 from npc_manager import NPCManager
 
+MONTH_NAMES = ("January", "February", "March", "April", "May", "June",
+               "July", "August", "September", "October", "November", "December")
+
+class _ConnectionPool:
+    """
+    Stands in for a sqlite3.Connection, backed by at most `size` connections to
+    the database file. A thread (or greenlet, under gevent) takes a connection
+    on its first use and keeps it until release(), which the web server calls
+    at the end of every request; connections are opened, and their pragmas
+    applied, only when none is free, so they keep their page cache between
+    requests. A request reading the DB never sees, or interleaves with, another
+    request's open write transaction. Supports the Connection API the managers
+    use, including `with db:` transactions.
+    """
+    def __init__(self, db_path: str, size: int = 16):
+        self._db_path = db_path
+        self._size = size
+        self._opened = 0
+        self._open_lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        # Larger statement cache: the managers reuse a fixed set of SQL strings
+        conn = sqlite3.connect(self._db_path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        # WAL + NORMAL sync: commits no longer fsync the main DB file each time
+        apply_pragmas(conn, cache_kib=65536)
+        conn.execute("PRAGMA wal_autocheckpoint=1000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._open_lock:
+                    can_open = self._opened < self._size
+                    if can_open:
+                        self._opened += 1
+                # at the limit: wait for another thread to release one
+                conn = self._open() if can_open else self._idle.get()
+            self._local.conn = conn
+        return conn
+
+    def release(self):
+        """Hand this thread's connection back to the pool (rolling back anything left open)."""
+        conn = self._local.__dict__.pop("conn", None)
+        if conn is not None:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        """Close the connections that are currently free (at shutdown)."""
+        self.release()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __getattr__(self, name):
+        return getattr(self._conn(), name)
+
+    def __enter__(self):
+        return self._conn().__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn().__exit__(*exc_info)
+
 class GameEngine:
     """
     This class ties the entire game together:
@@ -21,12 +99,15 @@ class GameEngine:
     """
 
     def __init__(self, db_path="game.db"):
-        self.db = sqlite3.connect(db_path, check_same_thread=False)
-        self.db.row_factory = sqlite3.Row
+        # Pooled connections, one per server thread at a time (see _ConnectionPool);
+        # actions (the write path) take this lock so only one writes at a time,
+        # and readers take it to copy the chunk they work from (_chunk_snapshot)
+        self.db = _ConnectionPool(db_path)
+        self.write_lock = threading.RLock()
 
-        # Cohere + RAG
-        self.ai = cohere.ClientV2(api_key=COHERE_API_KEY)
-        self.rag = LoreRAG(cohere_api_key=COHERE_API_KEY, collection_name="hex_game_lore")
+        # Cohere + RAG share one client (and its HTTP connection pool)
+        self.ai = get_client()
+        self.rag = LoreRAG(cohere_api_key=COHERE_API_KEY, collection_name="hex_game_lore", cohere_client=self.ai)
 
         # Setup DB tables
         self.setup_tables()
@@ -38,6 +119,8 @@ class GameEngine:
         self.location_manager = LocationManager(self.db, self.chunk_manager)
         self.npc_manager = NPCManager(self.db, self.ai)
         self.site_manager = SiteManager(self.db, self.ai, self.rag, self.npc_manager)
+        # setup ran on the constructing thread; don't keep a connection pinned to it
+        self.db.release()
 
     def setup_tables(self):
         self.db.executescript("""
@@ -58,6 +141,22 @@ class GameEngine:
             r INTEGER,
             data_json TEXT
         );
+        -- chunk lookups by coordinate (and the map's range queries) use this
+        -- instead of scanning the table
+        CREATE INDEX IF NOT EXISTS idx_chunks_qr ON chunks(q, r);
+
+        -- Bumped on every change to chunks; map_data uses it as the map's ETag
+        CREATE TABLE IF NOT EXISTS map_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO map_version (id, version) VALUES (0, 0);
+        CREATE TRIGGER IF NOT EXISTS chunks_version_ins AFTER INSERT ON chunks
+        BEGIN UPDATE map_version SET version = version + 1; END;
+        CREATE TRIGGER IF NOT EXISTS chunks_version_upd AFTER UPDATE ON chunks
+        BEGIN UPDATE map_version SET version = version + 1; END;
+        CREATE TRIGGER IF NOT EXISTS chunks_version_del AFTER DELETE ON chunks
+        BEGIN UPDATE map_version SET version = version + 1; END;
 
         -- New NPC table
         CREATE TABLE IF NOT EXISTS npc (
@@ -178,7 +277,7 @@ class GameEngine:
         4) follow_up_actions: contextual actions based on current state (e.g. NPC interactions)
         """
         p = self.get_player_state()
-        chunk_data = self.chunk_manager.get_or_create_chunk_data(p["q"], p["r"])
+        chunk_data = self._chunk_snapshot(p)
         loc_obj = chunk_data["locations"].get(p["location_name"], {})
 
         location_movement = []
@@ -252,6 +351,10 @@ class GameEngine:
                 elif npc["status"] == "in_team":
                     follow_up_actions.append(f"dismiss {npc['name']}")
 
+        # With companions along, the whole team can be asked at once
+        if self._team_ids(p):
+            follow_up_actions.append("ask team about rumors")
+
         return {
             "location_movement": location_movement,
             "site_movement": site_movement,
@@ -259,7 +362,42 @@ class GameEngine:
             "follow_up_actions": follow_up_actions
         }
 
+    def iter_site_actions(self):
+        """
+        Stream the AI-generated actions for the site the player is in, one at a
+        time as they arrive (see SiteManager.iter_site_actions). Yields nothing
+        when the player isn't inside a site.
+        """
+        p = self.get_player_state()
+        if not p["place_name"]:
+            return
+        chunk_data = self._chunk_snapshot(p)
+        yield from self.site_manager.iter_site_actions(chunk_data, p["location_name"], p["place_name"])
+
+    def _current_chunk(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        """The player's chunk, from SiteManager's chunk cache when it has been loaded before."""
+        return (self.site_manager.get_chunk(p["q"], p["r"])
+                or self.chunk_manager.get_or_create_chunk_data(p["q"], p["r"]))
+
+    def _chunk_snapshot(self, p: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        A private copy of the player's chunk for the read paths. Actions edit the
+        cached chunk in place before they commit, so it is copied under
+        write_lock: readers never iterate a dict an action is changing, and never
+        see an action's uncommitted edits.
+        """
+        with self.write_lock:
+            return loads(dumps(self._current_chunk(p)))
+
     def apply_action(self, chosen_action: str) -> str:
+        with self.write_lock:
+            try:
+                return self._dispatch_action(chosen_action)
+            finally:
+                # Movement helpers defer their commit; write it once per action
+                self.location_manager.flush()
+
+    def _dispatch_action(self, chosen_action: str) -> str:
         p = self.get_player_state()
 
         # Periodic stat changes
@@ -272,26 +410,28 @@ class GameEngine:
             return self.do_rest()
         if chosen_action == "check inventory":
             return self.do_check_inventory()
+        if chosen_action == "ask team about rumors":
+            return self.ask_team_about_rumors(p)
 
         # site or location
         if p["place_name"]:
             if chosen_action == "leave site":
                 return self.site_manager.do_leave_site(p)
             elif chosen_action == "search site":
-                chunk_data = self.chunk_manager.get_or_create_chunk_data(p["q"], p["r"])
+                chunk_data = self._current_chunk(p)
                 return self.site_manager.do_search_site(p, chunk_data)
             else:
-                chunk_data = self.chunk_manager.get_or_create_chunk_data(p["q"], p["r"])
+                chunk_data = self._current_chunk(p)
                 return self.site_manager.handle_site_action(p, chunk_data, p["place_name"], chosen_action)
         else:
             if chosen_action == "search location":
-                chunk_data = self.chunk_manager.get_or_create_chunk_data(p["q"], p["r"])
+                chunk_data = self._current_chunk(p)
                 return self.site_manager.do_search_location_for_new_site(p, chunk_data)
             if chosen_action.startswith("exit:"):
                 return self.location_manager.do_exit_chunk(p, chosen_action)
             if chosen_action.startswith("enter "):
                 site_name = chosen_action.replace("enter ", "").strip()
-                chunk_data = self.chunk_manager.get_or_create_chunk_data(p["q"], p["r"])
+                chunk_data = self._current_chunk(p)
                 return self.site_manager.do_enter_site(p, chunk_data, site_name)
             elif chosen_action.startswith("talk to "):
                 npc_name = chosen_action[8:]  # Remove "talk to " prefix
@@ -483,9 +623,8 @@ class GameEngine:
         context_bits.append(f" - Alignment: {detailed_stats['alignment']['value']}/100 ({detailed_stats['alignment']['rating']})")
         
         # Add time information
-        month_names = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
         month_num = detailed_stats["time"]["month"]
-        month_name = month_names[(month_num-1) % 12]
+        month_name = MONTH_NAMES[(month_num-1) % 12]
         time_text = f"{detailed_stats['time']['hour']}:00, {month_name} {detailed_stats['time']['day']}, Year {detailed_stats['time']['year']} AC"
         context_bits.append(f" - Current Time: {time_text}")
         
@@ -672,7 +811,7 @@ Context:
         Returns detailed information about the current location including
         description, connections, sites, and recent events.
         """
-        chunk_data = self.chunk_manager.get_or_create_chunk_data(q, r)
+        chunk_data = self._current_chunk({"q": q, "r": r})
         loc_obj = chunk_data["locations"].get(location_name, {})
         
         if not loc_obj:
@@ -723,6 +862,7 @@ Context:
         """
         map_data = []
         cursor = self.db.cursor()
+        cursor.row_factory = None
         
         # Calculate the range of coordinates to query
         min_q = center_q - radius
@@ -735,12 +875,18 @@ Context:
             "SELECT q, r, data_json FROM chunks WHERE q >= ? AND q <= ? AND r >= ? AND r <= ?",
             (min_q, max_q, min_r, max_r)
         ).fetchall()
+        # Sites are stored in their own table, so count them there
+        site_counts = {
+            (q, r, loc): n for q, r, loc, n in cursor.execute(
+                "SELECT q, r, location_name, COUNT(*) FROM sites "
+                "WHERE q >= ? AND q <= ? AND r >= ? AND r <= ? GROUP BY q, r, location_name",
+                (min_q, max_q, min_r, max_r)
+            )
+        }
         
-        for row in rows:
+        for q, r, data_json in rows:
             try:
-                q = row[0]
-                r = row[1]
-                chunk_data = json.loads(row[2])
+                chunk_data = loads(data_json)
                 
                 # Simplify the chunk data to include only essential information
                 locations = []
@@ -748,7 +894,7 @@ Context:
                     loc_info = {
                         "name": loc_name,
                         "visible": loc_data.get("visible", True),
-                        "site_count": len(loc_data.get("sites", {}))
+                        "site_count": site_counts.get((q, r, loc_name), 0)
                     }
                     locations.append(loc_info)
                 
@@ -760,7 +906,7 @@ Context:
                     "locations": locations
                 })
             except Exception as e:
-                print(f"Error processing chunk data at ({row[0]}, {row[1]}): {e}")
+                print(f"Error processing chunk data at ({q}, {r}): {e}")
         
         return {
             "center": {"q": center_q, "r": center_r},
@@ -772,6 +918,7 @@ Context:
     def advance_time(self, hours: int):
         """
         Add 'hours' to the player's current time, handling day/month/year rollover.
+        time_month always stays within 1..12 (the server looks month names up by it).
         """
         # fetch current time
         p = self.get_player_state()
@@ -827,6 +974,31 @@ Context:
         
         return f"You don't see {npc_name} here."
 
+    def _team_ids(self, p: Dict[str, Any]) -> List[int]:
+        """The NPC IDs in the player's team (empty if npc_team is unset or malformed)."""
+        try:
+            return loads_list(p.get("npc_team"))
+        except JSONDecodeError:
+            return []
+
+    def ask_team_about_rumors(self, p: Dict[str, Any]) -> str:
+        """Ask every NPC in the team for rumors; their Cohere calls run side by side."""
+        team = self._team_ids(p)
+        if not team:
+            return "You have no companions to ask."
+        replies = self.npc_manager.ask_npcs(team, "rumor")
+        lines = []
+        for npc_id in team:
+            npc = self.npc_manager.get_npc_for_conversation(npc_id)
+            name = npc["name"] if npc else "Someone"
+            lines.append(f"{name}: {replies[npc_id]}")
+        return "\n\n".join(lines)
+
+    def close(self):
+        """Stop the NPC workers and close the pooled connections (at shutdown)."""
+        self.npc_manager.close()
+        self.db.close()
+
     def recruit_npc(self, npc_name: str) -> str:
         """Try to recruit an NPC to your team."""
         player_state = self.get_player_state()
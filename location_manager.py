@@ -12,6 +12,17 @@ class LocationManager:
     def __init__(self, db: sqlite3.Connection, chunk_manager):
         self.db = db
         self.chunk_manager = chunk_manager
+        # Set by the _set_player_* helpers; flush() commits once per action
+        self._dirty = False
+
+    def flush(self):
+        """
+        Commit any player updates made since the last flush. Called by the engine
+        after each action so a move costs one commit instead of one per UPDATE.
+        """
+        if self._dirty:
+            self.db.commit()
+            self._dirty = False
 
     def do_move_to_location(self, p: Dict[str, Any], loc_name: str) -> str:
         """
@@ -89,15 +100,15 @@ class LocationManager:
     def _set_player_chunk(self, player_id: int, q: int, r: int):
         c = self.db.cursor()
         c.execute("UPDATE player SET q=?, r=? WHERE player_id=?", (q, r, player_id))
-        self.db.commit()
+        self._dirty = True
 
     def _set_player_location(self, player_id: int, loc_name: str):
         c = self.db.cursor()
         c.execute("UPDATE player SET location_name=?, place_name=NULL WHERE player_id=?",
                   (loc_name, player_id))
-        self.db.commit()
+        self._dirty = True
 
     def _set_player_place(self, player_id: int, place_name: str):
         c = self.db.cursor()
         c.execute("UPDATE player SET place_name=? WHERE player_id=?", (place_name, player_id))
-        self.db.commit()
+        self._dirty = True
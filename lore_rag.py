@@ -10,11 +10,13 @@ import chromadb
 import numpy as np
 from chromadb.utils import embedding_functions
 from cohere_secrets import COHERE_API_KEY
+from cohere_client import get_client
 
 # Create a custom embedding function that returns numpy arrays
 class CustomCohereEmbedder:
-    def __init__(self, api_key):
-        self.client = cohere.Client(api_key)
+    def __init__(self, client: cohere.ClientV2 = None):
+        # Reuse the shared client so embeds ride the same connection pool as chats
+        self.client = client or get_client()
     
     def __call__(self, input):
         if not input:
@@ -22,10 +24,11 @@ class CustomCohereEmbedder:
         response = self.client.embed(
             texts=input,
             model="embed-english-v3.0",
-            input_type="search_document"
+            input_type="search_document",
+            embedding_types=["float"]
         )
         # Convert to numpy arrays
-        return [np.array(embedding, dtype=np.float32) for embedding in response.embeddings]
+        return [np.array(embedding, dtype=np.float32) for embedding in response.embeddings.float_]
 
 class LoreRAG:
     """
@@ -33,15 +36,16 @@ class LoreRAG:
     and retrieve them by semantic similarity for RAG.
     """
 
-    def __init__(self, cohere_api_key: str, collection_name="hex_game_lore"):
+    def __init__(self, cohere_api_key: str, collection_name="hex_game_lore", cohere_client: cohere.ClientV2 = None):
         """
         cohere_api_key: your Cohere API key
         collection_name: the name of your Chroma collection (like a "database table" for your lore)
+        cohere_client: optional client to embed with (defaults to the shared one)
         """
         self.cohere_api_key = cohere_api_key
 
         # Create an embedding function using Cohere
-        self.embedder = CustomCohereEmbedder(api_key=self.cohere_api_key)
+        self.embedder = CustomCohereEmbedder(client=cohere_client)
 
         # Initialize the Chroma client (uses local .chromadb directory)
         self.chroma_client = chromadb.Client()
@@ -97,6 +97,58 @@ def migrate_db(db_path="game.db"):
     """)
     print("Ensured conversation_history table exists.")
 
+    # --- Create npc_memory table if it does not exist ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS npc_memory (
+        mem_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        npc_id INTEGER NOT NULL,
+        ts TIMESTAMP,
+        entry TEXT,
+        FOREIGN KEY (npc_id) REFERENCES npc(npc_id)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_npc_mem_npc ON npc_memory(npc_id, mem_id)")
+    print("Ensured npc_memory table exists.")
+
+    # --- Create npc_long_memory table if it does not exist ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS npc_long_memory (
+        npc_id INTEGER PRIMARY KEY,
+        summary TEXT,
+        covers INTEGER DEFAULT 0,
+        updated TIMESTAMP,
+        FOREIGN KEY (npc_id) REFERENCES npc(npc_id)
+    );
+    """)
+    print("Ensured npc_long_memory table exists.")
+
+    # --- Create sites / entities tables if they do not exist ---
+    # (sites still inside chunk blobs are moved over when the game next starts)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sites (
+        q INTEGER,
+        r INTEGER,
+        location_name TEXT,
+        site_name TEXT,
+        discovered INTEGER,
+        description TEXT,
+        data_json TEXT,
+        PRIMARY KEY (q, r, location_name, site_name)
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS entities (
+        q INTEGER,
+        r INTEGER,
+        location_name TEXT,
+        site_name TEXT,
+        idx INTEGER,
+        entity_json TEXT,
+        PRIMARY KEY (q, r, location_name, site_name, idx)
+    );
+    """)
+    print("Ensured sites and entities tables exist.")
+
     db.commit()
     db.close()
     print("Migration complete.")
@@ -1,18 +1,122 @@
 # npc_manager.py
 
 import sqlite3
-import json
-import datetime
+import hashlib
+import queue
+import time
+import threading
 import cohere
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from random import Random
 from typing import Optional, Dict, Any
 
+from fast_json import dumps, loads, JSONDecodeError
+
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                    format="%(asctime)s [%(levelname)s] %(message)s",
                    datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(__name__)
 
+# Column projections for the hot reads. Conversation handlers only need who the
+# NPC is; location listings only need enough to build the action menu.
+_NPC_COLS_CONV = "npc_id, name, personality"
+_NPC_COLS_LOC = "npc_id, name, status, current_q, current_r, location_name, site_name"
+
+# (whole second, formatted) for _now_iso(); swapped as one tuple so it's thread-safe
+_last_ts = (0, "")
+
+def _now_iso() -> str:
+    """
+    Local time as 'YYYY-MM-DDTHH:MM:SS' (datetime.now().isoformat() without the
+    microseconds), formatted at most once per second and reused in between.
+    """
+    global _last_ts
+    t = int(time.time())
+    if _last_ts[0] != t:
+        _last_ts = (t, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)))
+    return _last_ts[1]
+
+# Module-wide RNG for spawning; call _RNG.seed(n) for reproducible spawns
+_RNG = Random()
+
+# How long a cached NPC row is trusted before re-reading it from the DB
+NPC_CACHE_TTL = 5.0
+
+# Once an NPC has more than MEMORY_COMPACT_AT memory entries, everything
+# but the newest MEMORY_KEEP is folded into its long-term summary
+MEMORY_COMPACT_AT = 24
+MEMORY_KEEP = 12
+# After a failed compaction (no summary), don't try that NPC again for this long
+MEMORY_COMPACT_RETRY = 300.0
+
+# Applied to every pooled reader, matching the engine's writer connection
+_READ_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+class _ReadPool:
+    """
+    A fixed set of read-only connections to the same database file as the main
+    (writer) connection. Under WAL, lookups on these connections don't wait on
+    the writer, so NPC reads can proceed while memory/location updates commit.
+
+    For in-memory databases there is no file to share, so acquire() just hands
+    back the main connection.
+    """
+    def __init__(self, db: sqlite3.Connection, size: int = 4):
+        self._db = db
+        self._conns = None
+
+        path = db.execute("PRAGMA database_list").fetchone()[2]
+        if not path:
+            return
+        uri = Path(path).as_uri() + "?mode=ro"
+        self._conns = queue.Queue()
+        for _ in range(size):
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            for pragma in _READ_PRAGMAS:
+                conn.execute(pragma)
+            self._conns.put(conn)
+
+    @contextmanager
+    def acquire(self):
+        if self._conns is None:
+            yield self._db
+            return
+        conn = self._conns.get()
+        try:
+            yield conn
+        finally:
+            self._conns.put(conn)
+
+@contextmanager
+def _write_txn(db: sqlite3.Connection):
+    """
+    `with db:` for a write that may run inside a caller's transaction (a site
+    action, see site_manager._one_transaction). There it runs in a SAVEPOINT
+    instead: a failure undoes only its own writes, and committing is left to
+    the caller.
+    """
+    if not db.in_transaction:
+        with db:
+            yield
+        return
+    db.execute("SAVEPOINT npc_write")
+    try:
+        yield
+    except BaseException:
+        db.execute("ROLLBACK TO npc_write")
+        db.execute("RELEASE npc_write")
+        raise
+    db.execute("RELEASE npc_write")
+
 class NPCManager:
     """
     The NPCManager handles the creation, retrieval, memory updates, conversation handling,
@@ -21,16 +125,259 @@ class NPCManager:
     It uses a SQLite database connection to persist NPC data and a Cohere AI client to generate
     in-character responses based on each NPC's personality, memory, and context.
     """
-    def __init__(self, db: sqlite3.Connection, ai_client: cohere.Client):
+
+    # System prompt for interact_with_npc, filled in with %-formatting each turn
+    _SYS_TMPL = (
+        "\nYou are %(name)s, an NPC with the following personality:\n"
+        "%(personality)s\n"
+        "\n"
+        "What you remember from before:\n"
+        "%(long_term)s\n"
+        "\n"
+        "Your recent memories:\n"
+        "%(memories)s\n"
+        "\n"
+        "Current context:\n"
+        "Location: %(loc)s in chunk (%(q)s, %(r)s)\n"
+        "Player history: %(hist)s\n"
+        "\n"
+        "The player says: \"%(inp)s\"\n"
+        "Respond in character with a short, natural dialogue. If relevant, recall past interactions.\n"
+    )
+
+    # System prompt for _compact_memory
+    _SUMMARY_TMPL = (
+        "You maintain the long-term memory of an NPC in a fantasy game.\n"
+        "Merge the existing summary and the older interactions below into a single short paragraph "
+        "(at most 120 words). Keep names, places, promises, debts, quests and how the NPC feels "
+        "about the player; drop small talk.\n"
+        "\n"
+        "Existing summary:\n"
+        "{previous}\n"
+        "\n"
+        "Older interactions:\n"
+        "{events}\n"
+    )
+
+    # kind -> (system prompt template, user message, fallback reply) for _inquire
+    _INQUIRIES = {
+        "quest": (
+            "You are {name}, with this personality: {personality}.\n"
+            "Generate a response about what quests or tasks you might have for the player.\n"
+            "Keep it brief (1-2 sentences) and in character.",
+            "What quests do you have available?",
+            "{name} seems distracted and doesn't respond.",
+        ),
+        "rumor": (
+            "You are {name}, with this personality: {personality}.\n"
+            "Share an interesting rumor or piece of gossip about the local area.\n"
+            "Keep it brief (1-2 sentences) and in character.",
+            "Have you heard any interesting rumors lately?",
+            "{name} glances around nervously but says nothing.",
+        ),
+        "trade": (
+            "You are {name}, with this personality: {personality}.\n"
+            "Respond to a player's request to trade.\n"
+            "Keep it brief (1-2 sentences) and in character.",
+            "I'd like to trade with you.",
+            "{name} seems uninterested in trading right now.",
+        ),
+    }
+
+    def __init__(self, db: sqlite3.Connection, ai_client: cohere.Client,
+                 ai_cache_size: int = 1024, ai_cache_ttl: float = 600.0):
         """
         Initialize the NPC Manager.
         
         :param db: SQLite database connection.
         :param ai_client: Cohere client for AI interactions.
+        :param ai_cache_size: Max number of cached AI responses (oldest evicted first).
+        :param ai_cache_ttl: Seconds a cached AI response stays valid.
         """
         self.db = db
         self.ai = ai_client
 
+        # Exact-match AI response cache: blake2b(system prompt + user message)
+        # -> (expires_at, text). Insertion-ordered, so eviction is FIFO.
+        self.ai_cache_size = ai_cache_size
+        self.ai_cache_ttl = ai_cache_ttl
+        self._ai_cache: Dict[bytes, tuple] = {}
+        # Held while evicting and inserting; lookups are plain .get()s
+        self._ai_cache_lock = threading.Lock()
+
+        # (npc_id, inquiry kind) -> (name, system prompt, response-cache key).
+        # Name and personality are never updated, so entries don't need invalidating.
+        self._prompt_cache: Dict[tuple, tuple] = {}
+
+        # Worker threads for Cohere calls that can overlap (see ask_npcs) or that
+        # shouldn't hold up a request (memory compaction); a team has at most 4
+        # NPCs. Shut down by close().
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="npc-ai")
+
+        # Compaction bookkeeping, under _compact_lock: NPCs with a compaction
+        # queued or running, and npc_id -> monotonic time before which a failed
+        # one isn't retried
+        self._compact_lock = threading.Lock()
+        self._compacting = set()
+        self._compact_retry_at: Dict[int, float] = {}
+
+        self.ensure_indexes()
+
+        # Readers for lookups; writes and read-modify-write stay on self.db
+        self._pool = _ReadPool(db)
+
+        # Short-lived NPC row caches: npc_id -> (expires_at, npc) and
+        # (name, q, r, location_name) -> (expires_at, npc). Every write that
+        # touches an NPC row drops its entries via _invalidate_npc().
+        self._npc_cache: Dict[int, tuple] = {}
+        self._npc_name_cache: Dict[tuple, tuple] = {}
+
+        # SQL text -> result column names, read from cursor.description the first
+        # time a statement runs (see _fetch_dicts)
+        self._row_cols: Dict[str, tuple] = {}
+
+        # Fixed SQL text per operation. Reusing the exact same string lets the
+        # connection's statement cache hand back the already-prepared statement.
+        self._stmts = {
+            "get_by_id": "SELECT * FROM npc WHERE npc_id = ?",
+            "get_conv": f"SELECT {_NPC_COLS_CONV} FROM npc WHERE npc_id = ?",
+            "get_loc": f"SELECT {_NPC_COLS_LOC} FROM npc WHERE npc_id = ?",
+            # Newest-first so "the last N entries" is an index range scan (LIMIT -1 = all)
+            "get_memory": "SELECT entry FROM npc_memory WHERE npc_id = ? ORDER BY mem_id DESC LIMIT ?",
+            "get_long_mem": "SELECT summary FROM npc_long_memory WHERE npc_id = ?",
+            "insert_mem": "INSERT INTO npc_memory (npc_id, ts, entry) VALUES (?, ?, ?)",
+            # mem_count is kept up to date by triggers on npc_memory (see ensure_indexes)
+            "touch_npc": "UPDATE npc SET last_interaction = ? WHERE npc_id = ? RETURNING mem_count",
+            "all_mem": "SELECT mem_id, entry FROM npc_memory WHERE npc_id = ? ORDER BY mem_id",
+            "trim_mem": "DELETE FROM npc_memory WHERE npc_id = ? AND mem_id <= ?",
+            "upsert_long_mem": """
+                INSERT INTO npc_long_memory (npc_id, summary, covers, updated)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(npc_id) DO UPDATE
+                SET summary = excluded.summary,
+                    covers = covers + excluded.covers,
+                    updated = excluded.updated
+            """,
+            "update_loc": """
+                UPDATE npc 
+                SET current_q = ?, current_r = ?, location_name = ?, site_name = ?, last_interaction = ?
+                WHERE npc_id = ?
+            """,
+            "insert_npc": """
+                INSERT INTO npc 
+                (name, personality, memory, home_q, home_r, current_q, current_r, location_name, site_name, status, last_interaction)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            "insert_conv": """
+                INSERT INTO conversation_history (npc_id, player_id, dialogue)
+                VALUES (?, ?, ?)
+            """,
+            "npcs_in_loc": f"SELECT {_NPC_COLS_LOC} FROM npc WHERE current_q=? AND current_r=? AND location_name=?",
+            "npcs_in_loc_site": f"SELECT {_NPC_COLS_LOC} FROM npc WHERE current_q=? AND current_r=? AND location_name=? AND site_name=?",
+            # Team membership is edited in SQL (JSON1). A NULL, empty or malformed
+            # npc_team is treated as an empty team, as the old Python path did.
+            "team_add": """
+                UPDATE player
+                SET npc_team = json_insert(CASE WHEN json_valid(npc_team) THEN npc_team ELSE '[]' END, '$[#]', ?)
+                WHERE player_id = ?
+                  AND json_array_length(CASE WHEN json_valid(npc_team) THEN npc_team ELSE '[]' END) < 4
+            """,
+            "team_remove": """
+                UPDATE player
+                SET npc_team = (SELECT json_group_array(value) FROM json_each(npc_team) WHERE value != ?)
+                WHERE player_id = ?
+                  AND json_valid(npc_team)
+                  AND EXISTS (SELECT 1 FROM json_each(npc_team) WHERE value = ?)
+            """,
+            "update_status": "UPDATE npc SET status=? WHERE npc_id=?",
+        }
+
+        # get_npc_by_name variants, keyed by (coords given) << 1 | (location given),
+        # so each filter combination always maps to the same prepared SQL text
+        self._get_by_name = {
+            0b00: "SELECT * FROM npc WHERE name = ?",
+            0b01: "SELECT * FROM npc WHERE name = ? AND location_name = ?",
+            0b10: "SELECT * FROM npc WHERE name = ? AND current_q = ? AND current_r = ?",
+            0b11: "SELECT * FROM npc WHERE name = ? AND current_q = ? AND current_r = ? AND location_name = ?",
+        }
+
+    def ensure_indexes(self):
+        """
+        Create the composite indexes behind the location and name lookups so they
+        are a single B-tree descent instead of a full scan of the npc table, plus
+        the memory tables on databases created before they existed.
+        
+        Memory entries left in the old npc.memory JSON column are moved into
+        npc_memory (in their original order) and the column is cleared.
+        
+        npc.mem_count (added and backfilled if missing) holds each NPC's number of
+        npc_memory rows, maintained by triggers, so appending an entry learns the
+        new count from the UPDATE it already makes instead of a COUNT(*).
+        """
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS npc_memory (
+                mem_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                npc_id INTEGER NOT NULL,
+                ts TIMESTAMP,
+                entry TEXT,
+                FOREIGN KEY (npc_id) REFERENCES npc(npc_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_npc_mem_npc ON npc_memory(npc_id, mem_id);
+            CREATE TABLE IF NOT EXISTS npc_long_memory (
+                npc_id INTEGER PRIMARY KEY,
+                summary TEXT,
+                covers INTEGER DEFAULT 0,
+                updated TIMESTAMP,
+                FOREIGN KEY (npc_id) REFERENCES npc(npc_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_npc_loc ON npc(current_q, current_r, location_name, site_name);
+            CREATE INDEX IF NOT EXISTS idx_npc_name_loc ON npc(name, current_q, current_r, location_name);
+            CREATE INDEX IF NOT EXISTS idx_conv_npc ON conversation_history(npc_id);
+            ANALYZE npc;
+
+            BEGIN;
+            INSERT INTO npc_memory (npc_id, ts, entry)
+                SELECT n.npc_id, json_extract(j.value, '$.timestamp'), j.value
+                FROM (SELECT npc_id, memory FROM npc
+                      WHERE CASE WHEN json_valid(memory) THEN json_type(memory) = 'array' END) n,
+                     json_each(n.memory) j
+                ORDER BY n.npc_id, j.key;
+            UPDATE npc SET memory = NULL WHERE CASE WHEN json_valid(memory) THEN json_type(memory) = 'array' END;
+            COMMIT;
+        """)
+
+        cols = {row[1] for row in self.db.execute("PRAGMA table_info(npc)")}
+        if "mem_count" not in cols:
+            self.db.executescript("""
+                BEGIN;
+                ALTER TABLE npc ADD COLUMN mem_count INTEGER NOT NULL DEFAULT 0;
+                UPDATE npc SET mem_count =
+                    (SELECT COUNT(*) FROM npc_memory m WHERE m.npc_id = npc.npc_id);
+                COMMIT;
+            """)
+        self.db.executescript("""
+            CREATE TRIGGER IF NOT EXISTS npc_mem_count_ins AFTER INSERT ON npc_memory
+            BEGIN UPDATE npc SET mem_count = mem_count + 1 WHERE npc_id = NEW.npc_id; END;
+            CREATE TRIGGER IF NOT EXISTS npc_mem_count_del AFTER DELETE ON npc_memory
+            BEGIN UPDATE npc SET mem_count = mem_count - 1 WHERE npc_id = OLD.npc_id; END;
+        """)
+
+    def _fetch_dicts(self, db: sqlite3.Connection, sql: str, params: tuple, limit: int = None) -> list:
+        """
+        Run a query and return its rows as plain dicts, built straight from the raw
+        tuples with the statement's cached column names (no sqlite3.Row in between).
+        
+        :param limit: Fetch at most this many rows (default: all of them).
+        """
+        cur = db.cursor()
+        cur.row_factory = None
+        cur.execute(sql, params)
+        cols = self._row_cols.get(sql)
+        if cols is None:
+            cols = self._row_cols[sql] = tuple(d[0] for d in cur.description)
+        rows = cur.fetchall() if limit is None else cur.fetchmany(limit)
+        return [dict(zip(cols, row)) for row in rows]
+
     # ============================================================
     # NPC Creation and Retrieval
     # ============================================================
@@ -51,53 +398,75 @@ class NPCManager:
         :param initial_memory: Optional list of memory entries.
         :return: The NPC ID of the newly created NPC.
         """
-        if initial_memory is None:
-            initial_memory = []
-        memory_json = json.dumps(initial_memory)
-        now = datetime.datetime.now().isoformat()
-        cur = self.db.cursor()
-        cur.execute("""
-            INSERT INTO npc 
-            (name, personality, memory, home_q, home_r, current_q, current_r, location_name, site_name, status, last_interaction)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (name, personality, memory_json, home_q, home_r, home_q, home_r, None, None, "wandering", now))
-        self.db.commit()
-        return cur.lastrowid
+        now = _now_iso()
+        with _write_txn(self.db):
+            cur = self.db.execute(self._stmts["insert_npc"],
+                                  (name, personality, None, home_q, home_r, home_q, home_r, None, None, "wandering", now))
+            npc_id = cur.lastrowid
+            if initial_memory:
+                self.db.executemany(self._stmts["insert_mem"],
+                                    [(npc_id, entry.get("timestamp", now), dumps(entry))
+                                     for entry in initial_memory])
+        return npc_id
+
+    def create_npcs_bulk(self, specs: list) -> list:
+        """
+        Create several NPCs, already placed at their locations, with one executemany
+        in a single transaction (one commit for the whole batch, or none if the
+        caller already has a transaction open).
+        
+        Each NPC starts out like one from create_npc, except that its location and
+        site are set right away instead of by a follow-up update_npc_location.
+        
+        :param specs: A list of (name, personality, q, r, location_name, site_name)
+                      tuples; (q, r) is used as both the home and current chunk.
+        :return: The new NPC IDs, in the same order as specs.
+        """
+        if not specs:
+            return []
+        now = _now_iso()
+        rows = [(name, personality, None, q, r, q, r, location_name, site_name, "wandering", now)
+                for name, personality, q, r, location_name, site_name in specs]
+        with _write_txn(self.db):
+            self.db.executemany(self._stmts["insert_npc"], rows)
+            # AUTOINCREMENT rowids from one statement on one connection are consecutive
+            last = self.db.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last - len(rows) + 1, last + 1))
 
     def spawn_npc(self, current_q: int, current_r: int, location_name: str, site_name: str = None) -> Optional[Dict[str, Any]]:
         """
         Check if there is an NPC at the given chunk and location (and optionally, site).
         If one exists, return it. Otherwise, with a certain probability, create a new NPC.
         Returns None if no NPC is present and none is spawned.
+
+        Either way the NPC comes back as the location projection (_NPC_COLS_LOC:
+        npc_id, name, status, current_q, current_r, location_name, site_name), not
+        the full row; use get_npc_by_id for personality or memory.
         """
         try:
-            cur = self.db.cursor()
-            if site_name:
-                cur.execute(
-                    "SELECT * FROM npc WHERE current_q=? AND current_r=? AND location_name=? AND site_name=?",
-                    (current_q, current_r, location_name, site_name)
-                )
-            else:
-                cur.execute(
-                    "SELECT * FROM npc WHERE current_q=? AND current_r=? AND location_name=?",
-                    (current_q, current_r, location_name)
-                )
-            row = cur.fetchone()
-            if row:
-                return dict(row)
+            with self._pool.acquire() as db:
+                if site_name:
+                    rows = self._fetch_dicts(db, self._stmts["npcs_in_loc_site"],
+                                             (current_q, current_r, location_name, site_name), 1)
+                else:
+                    rows = self._fetch_dicts(db, self._stmts["npcs_in_loc"],
+                                             (current_q, current_r, location_name), 1)
+            if rows:
+                return rows[0]
             
             # No NPC is present; decide whether to spawn one (50% chance)
-            import random
-            if random.random() < 0.5:
+            if _RNG.random() < 0.5:
                 # Generate a new NPC with default details
                 default_personality = "A friendly wanderer who loves to share stories and values honesty."
                 new_name = "Noah"  # This could be randomized or generated via AI
-                npc_id = self.create_npc(new_name, default_personality, current_q, current_r)
-                # Update NPC location with site name if provided
-                self.update_npc_location(npc_id, current_q, current_r, location_name, site_name)
-                npc = self.get_npc_by_id(npc_id)
-                if npc:
-                    return npc
+                # Created already placed (with the site name, if provided) in one transaction
+                npc_id, = self.create_npcs_bulk(
+                    [(new_name, default_personality, current_q, current_r, location_name, site_name)])
+                # Read back on the writer: inside a site action the row isn't
+                # committed yet, so the pooled readers can't see it
+                rows = self._fetch_dicts(self.db, self._stmts["get_loc"], (npc_id,), 1)
+                if rows:
+                    return rows[0]
             # No NPC spawns this time or creation failed
             return None
         except Exception as e:
@@ -111,12 +480,16 @@ class NPCManager:
         :param npc_id: The ID of the NPC to retrieve.
         :return: The NPC record as a dictionary, or None if not found.
         """
+        hit = self._npc_cache.get(npc_id)
+        if hit and hit[0] > time.monotonic():
+            return dict(hit[1])
         try:
-            cur = self.db.cursor()
-            cur.execute("SELECT * FROM npc WHERE npc_id = ?", (npc_id,))
-            row = cur.fetchone()
-            if row:
-                return dict(row)
+            with self._pool.acquire() as db:
+                rows = self._fetch_dicts(db, self._stmts["get_by_id"], (npc_id,), 1)
+            if rows:
+                npc = rows[0]
+                self._npc_cache[npc_id] = (time.monotonic() + NPC_CACHE_TTL, npc)
+                return dict(npc)
             return None
         except sqlite3.Error as e:
             logger.error(f"Database error while getting NPC by ID: {e}", exc_info=True)
@@ -125,6 +498,25 @@ class NPCManager:
             logger.error(f"Unexpected error while getting NPC by ID: {e}", exc_info=True)
             return None
 
+    def get_npc_for_conversation(self, npc_id: int):
+        """
+        Retrieve just the columns the conversation handlers need (npc_id, name,
+        personality). Uses the cached full row when there is one.
+        
+        :param npc_id: The ID of the NPC.
+        :return: A dict with (at least) those keys, or None if not found.
+        """
+        hit = self._npc_cache.get(npc_id)
+        if hit and hit[0] > time.monotonic():
+            return dict(hit[1])
+        try:
+            with self._pool.acquire() as db:
+                rows = self._fetch_dicts(db, self._stmts["get_conv"], (npc_id,), 1)
+            return rows[0] if rows else None
+        except sqlite3.Error as e:
+            logger.error(f"Database error while getting NPC for conversation: {e}", exc_info=True)
+            return None
+
     def get_npc_by_name(self, name: str, current_q: int = None, current_r: int = None, location_name: str = None):
         """
         Retrieve an NPC by name. Optionally, filter the search by the current chunk coordinates
@@ -136,20 +528,24 @@ class NPCManager:
         :param location_name: (Optional) The current location name.
         :return: The NPC record as a dictionary, or None if not found.
         """
+        key = (name, current_q, current_r, location_name)
+        hit = self._npc_name_cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            return dict(hit[1])
         try:
-            cur = self.db.cursor()
-            query = "SELECT * FROM npc WHERE name = ?"
-            params = [name]
-            if current_q is not None and current_r is not None:
-                query += " AND current_q = ? AND current_r = ?"
-                params.extend([current_q, current_r])
-            if location_name is not None:
-                query += " AND location_name = ?"
-                params.append(location_name)
-            cur.execute(query, params)
-            row = cur.fetchone()
-            if row:
-                return dict(row)
+            has_coords = current_q is not None and current_r is not None
+            has_loc = location_name is not None
+            params = (name,)
+            if has_coords:
+                params += (current_q, current_r)
+            if has_loc:
+                params += (location_name,)
+            with self._pool.acquire() as db:
+                rows = self._fetch_dicts(db, self._get_by_name[has_coords << 1 | has_loc], params, 1)
+            if rows:
+                npc = rows[0]
+                self._npc_name_cache[key] = (time.monotonic() + NPC_CACHE_TTL, npc)
+                return dict(npc)
             return None
         except sqlite3.Error as e:
             logger.error(f"Database error while getting NPC by name: {e}", exc_info=True)
@@ -165,146 +561,234 @@ class NPCManager:
         """
         Append a new memory entry to the NPC's persistent memory.
         
-        The memory is stored as JSON (a list of memory entries) in the database.
-        Each new entry is appended to this list, and the last_interaction timestamp is updated.
+        Each entry is one JSON row in the npc_memory table, so appending is a single
+        INSERT, and the last_interaction timestamp is updated. Once an NPC has more than
+        MEMORY_COMPACT_AT entries, the older ones are summarized in the background
+        (see _schedule_compaction).
         
         :param npc_id: The ID of the NPC.
         :param new_memory_entry: A dictionary representing the new memory entry.
         """
         try:
-            cur = self.db.cursor()
-            cur.execute("SELECT memory FROM npc WHERE npc_id = ?", (npc_id,))
-            row = cur.fetchone()
-            if row:
-                try:
-                    current_memory = json.loads(row["memory"]) if row["memory"] else []
-                except Exception:
-                    current_memory = []
-                current_memory.append(new_memory_entry)
-                updated_memory = json.dumps(current_memory)
-                cur.execute("UPDATE npc SET memory = ?, last_interaction = ? WHERE npc_id = ?",
-                            (updated_memory, datetime.datetime.now().isoformat(), npc_id))
-                self.db.commit()
+            with _write_txn(self.db):
+                length = self._append_memory(npc_id, new_memory_entry)
+            self._invalidate_npc(npc_id)
+            if length > MEMORY_COMPACT_AT:
+                self._schedule_compaction(npc_id)
         except sqlite3.Error as e:
             logger.error(f"Database error while updating NPC memory: {e}", exc_info=True)
-            self.db.rollback()
         except Exception as e:
             logger.error(f"Unexpected error while updating NPC memory: {e}", exc_info=True)
-            self.db.rollback()
 
-    # ============================================================
-    # Conversation Handling
-    # ============================================================
-    def handle_quest_inquiry(self, npc_id: int) -> str:
-        """Handle when player asks NPC about available quests."""
-        npc = self.get_npc_by_id(npc_id)
-        if not npc:
-            return "That NPC is not available."
+    def _append_memory(self, npc_id: int, new_memory_entry: dict) -> int:
+        """Insert one memory entry (no commit) and return the NPC's entry count."""
+        now = _now_iso()
+        self.db.execute(self._stmts["insert_mem"], (npc_id, now, dumps(new_memory_entry)))
+        row = self.db.execute(self._stmts["touch_npc"], (now, npc_id)).fetchone()
+        return row[0] if row else 0
 
-        # Get NPC's personality and memory for context
-        personality = npc["personality"]
-        memory = json.loads(npc["memory"]) if npc["memory"] else []
-
-        system_prompt = f"""
-        You are {npc['name']}, with this personality: {personality}.
-        Generate a response about what quests or tasks you might have for the player.
-        Keep it brief (1-2 sentences) and in character.
+    def _schedule_compaction(self, npc_id: int):
+        """
+        Queue _compact_memory on the worker threads, so the summary's Cohere call
+        doesn't run on the request path. Skipped while one is already queued for
+        the NPC, or within MEMORY_COMPACT_RETRY of a failed attempt.
         """
+        with self._compact_lock:
+            if npc_id in self._compacting or self._compact_retry_at.get(npc_id, 0) > time.monotonic():
+                return
+            self._compacting.add(npc_id)
+        try:
+            self._executor.submit(self._compact_memory, npc_id)
+        except RuntimeError:  # shut down (see close)
+            with self._compact_lock:
+                self._compacting.discard(npc_id)
 
+    def _compact_memory(self, npc_id: int):
+        """
+        Fold all but the newest MEMORY_KEEP memory entries into the NPC's long-term
+        summary (npc_long_memory), so the number of entries per NPC stays bounded.
+        
+        If the summary can't be generated the memory is left as it is, and the next
+        attempt waits MEMORY_COMPACT_RETRY seconds (see _schedule_compaction).
+        
+        :param npc_id: The ID of the NPC.
+        """
+        failed = True
         try:
-            response = self.ai.chat(
-                model="command-r-08-2024",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "What quests do you have available?"}
-                ],
-                temperature=0.7
-            )
-            return response.message.content[0].text.strip()
+            rows = self.db.execute(self._stmts["all_mem"], (npc_id,)).fetchall()
+            if len(rows) <= MEMORY_COMPACT_AT:
+                failed = False
+                return
+            older = rows[:-MEMORY_KEEP]
+            previous = self.db.execute(self._stmts["get_long_mem"], (npc_id,)).fetchone()
+
+            events = []
+            for row in older:
+                entry = loads(row["entry"])
+                if "player_input" in entry and "npc_response" in entry:
+                    events.append(f"- Player: {entry['player_input']} / NPC: {entry['npc_response']}")
+                else:
+                    events.append(f"- {entry.get('summary') or row['entry']}")
+            prompt = self._SUMMARY_TMPL.format_map({
+                "previous": previous["summary"] if previous else "(none)",
+                "events": "\n".join(events),
+            })
+            summary = self._chat(prompt, "Write the updated summary.")
+
+            # Deleting by id range leaves entries appended meanwhile alone, and a
+            # concurrent compaction of the same rows finds nothing left to fold in
+            with _write_txn(self.db):
+                cur = self.db.execute(self._stmts["trim_mem"], (npc_id, older[-1]["mem_id"]))
+                if cur.rowcount:
+                    self.db.execute(self._stmts["upsert_long_mem"],
+                                    (npc_id, summary, cur.rowcount, _now_iso()))
+            failed = False
+        except sqlite3.Error as e:
+            logger.error(f"Database error while compacting NPC memory: {e}", exc_info=True)
         except Exception as e:
-            logger.error(f"Error generating quest response: {e}")
-            return f"{npc['name']} seems distracted and doesn't respond."
+            logger.error(f"Unexpected error while compacting NPC memory: {e}", exc_info=True)
+        finally:
+            with self._compact_lock:
+                self._compacting.discard(npc_id)
+                if failed:
+                    self._compact_retry_at[npc_id] = time.monotonic() + MEMORY_COMPACT_RETRY
+                else:
+                    self._compact_retry_at.pop(npc_id, None)
 
-    def handle_rumor_inquiry(self, npc_id: int) -> str:
-        """Handle when player asks NPC about local rumors."""
-        npc = self.get_npc_by_id(npc_id)
-        if not npc:
-            return "That NPC is not available."
+    # ============================================================
+    # Conversation Handling
+    # ============================================================
+    @staticmethod
+    def _cache_key(system_prompt: str, user_msg: str) -> bytes:
+        """Response-cache key for a (system prompt, user message) pair."""
+        return hashlib.blake2b(f"{system_prompt}\x00{user_msg}".encode(), digest_size=16).digest()
+
+    def _chat(self, system_prompt: str, user_msg: str, key: bytes = None) -> str:
+        """
+        Generate an in-character reply. A repeat of the same system prompt and user
+        message within ai_cache_ttl is answered from the cache, skipping the Cohere
+        round-trip entirely. Errors from the AI client propagate to the caller.
+        
+        :param key: Precomputed _cache_key(system_prompt, user_msg), if the caller has one.
+        """
+        if key is None:
+            key = self._cache_key(system_prompt, user_msg)
+        hit = self._ai_cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
+
+        response = self.ai.chat(
+            model="command-r-08-2024",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_msg}
+            ],
+            temperature=0.7
+        )
+        text = response.message.content[0].text.strip()
 
-        personality = npc["personality"]
-        memory = json.loads(npc["memory"]) if npc["memory"] else []
+        with self._ai_cache_lock:
+            if len(self._ai_cache) >= self.ai_cache_size:
+                self._ai_cache.pop(next(iter(self._ai_cache)), None)
+            self._ai_cache[key] = (time.monotonic() + self.ai_cache_ttl, text)
+        return text
 
-        system_prompt = f"""
-        You are {npc['name']}, with this personality: {personality}.
-        Share an interesting rumor or piece of gossip about the local area.
-        Keep it brief (1-2 sentences) and in character.
+    def _inquire(self, npc_id: int, kind: str) -> str:
         """
+        Answer one of the canned inquiries (see _INQUIRIES) for an NPC.
+        
+        The system prompt and its response-cache key only depend on the NPC's name
+        and personality, which never change after creation, so they are built once
+        per (npc_id, kind) and reused; a repeat inquiry within ai_cache_ttl then costs
+        two dict lookups.
+        """
+        user_msg, fallback = self._INQUIRIES[kind][1:]
+        entry = self._prompt_cache.get((npc_id, kind))
+        if entry is None:
+            npc = self.get_npc_for_conversation(npc_id)
+            if not npc:
+                return "That NPC is not available."
+            system_prompt = self._INQUIRIES[kind][0].format_map(
+                {"name": npc["name"], "personality": npc["personality"]})
+            entry = (npc["name"], system_prompt, self._cache_key(system_prompt, user_msg))
+            self._prompt_cache[(npc_id, kind)] = entry
+        name, system_prompt, key = entry
 
         try:
-            response = self.ai.chat(
-                model="command-r-08-2024",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "Have you heard any interesting rumors lately?"}
-                ],
-                temperature=0.7
-            )
-            return response.message.content[0].text.strip()
+            return self._chat(system_prompt, user_msg, key)
         except Exception as e:
-            logger.error(f"Error generating rumor response: {e}")
-            return f"{npc['name']} glances around nervously but says nothing."
+            logger.error(f"Error generating {kind} response: {e}")
+            return fallback.format(name=name)
+
+    def handle_quest_inquiry(self, npc_id: int) -> str:
+        """Handle when player asks NPC about available quests."""
+        return self._inquire(npc_id, "quest")
+
+    def handle_rumor_inquiry(self, npc_id: int) -> str:
+        """Handle when player asks NPC about local rumors."""
+        return self._inquire(npc_id, "rumor")
 
     def handle_trade(self, npc_id: int) -> str:
         """Handle when player wants to trade with an NPC."""
-        npc = self.get_npc_by_id(npc_id)
-        if not npc:
-            return "That NPC is not available."
+        return self._inquire(npc_id, "trade")
 
-        personality = npc["personality"]
+    def ask_npcs(self, npc_ids: list, inquiry: str) -> Dict[int, str]:
+        """
+        Put the same inquiry to several NPCs at once (e.g. the whole team).
+        
+        Each NPC's Cohere call runs on the manager's thread pool. The waits overlap,
+        so this takes about as long as the slowest reply, not the sum of all of them.
         
-        system_prompt = f"""
-        You are {npc['name']}, with this personality: {personality}.
-        Respond to a player's request to trade.
-        Keep it brief (1-2 sentences) and in character.
+        :param npc_ids: The IDs of the NPCs to ask.
+        :param inquiry: One of "quest", "rumor" or "trade".
+        :return: A dict mapping each NPC ID to its reply.
         """
+        if inquiry not in self._INQUIRIES:
+            raise KeyError(inquiry)
+        futures = {self._executor.submit(self._inquire, npc_id, inquiry): npc_id for npc_id in npc_ids}
+        replies = {}
+        for future in as_completed(futures):
+            replies[futures[future]] = future.result()
+        return replies
 
-        try:
-            response = self.ai.chat(
-                model="command-r-08-2024",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "I'd like to trade with you."}
-                ],
-                temperature=0.7
-            )
-            return response.message.content[0].text.strip()
-        except Exception as e:
-            logger.error(f"Error generating trade response: {e}")
-            return f"{npc['name']} seems uninterested in trading right now."
+    def close(self):
+        """Stop the worker threads, letting calls already submitted finish."""
+        self._executor.shutdown(wait=True)
 
     def get_npc_memory(self, npc_id: int):
         """
         Retrieve the NPC's memory from the database.
         
         :param npc_id: The ID of the NPC.
-        :return: A list of memory entries.
+        :return: A list of memory entries, oldest first.
+        """
+        return self._read_memory(npc_id)[0]
+
+    def _read_memory(self, npc_id: int, limit: int = -1):
+        """
+        Retrieve the NPC's memory entries and long-term summary.
+        
+        :param npc_id: The ID of the NPC.
+        :param limit: Only return the newest this many entries (-1 for all of them).
+        :return: A (memory entries oldest first, summary or None) tuple.
         """
         try:
-            cur = self.db.cursor()
-            cur.execute("SELECT memory FROM npc WHERE npc_id = ?", (npc_id,))
-            row = cur.fetchone()
-            if row:
+            with self._pool.acquire() as db:
+                rows = db.execute(self._stmts["get_memory"], (npc_id, limit)).fetchall()
+                long_row = db.execute(self._stmts["get_long_mem"], (npc_id,)).fetchone()
+            entries = []
+            for row in reversed(rows):
                 try:
-                    return json.loads(row["memory"]) if row["memory"] else []
-                except Exception:
-                    return []
-            return []
+                    entries.append(loads(row["entry"]))
+                except JSONDecodeError:
+                    continue
+            return entries, long_row["summary"] if long_row else None
         except sqlite3.Error as e:
             logger.error(f"Database error while getting NPC memory: {e}", exc_info=True)
-            return []
+            return [], None
         except Exception as e:
             logger.error(f"Unexpected error while getting NPC memory: {e}", exc_info=True)
-            return []
+            return [], None
 
     # ============================================================
     # Conversation and Interaction
@@ -315,6 +799,7 @@ class NPCManager:
         
         This method builds an AI prompt that incorporates:
           - The NPC's personality.
+          - The NPC's long-term memory summary.
           - A summary of recent memory entries.
           - Context about the current location and any relevant player history.
           - The player's input.
@@ -330,58 +815,42 @@ class NPCManager:
         """
         try:
             # Retrieve and summarize recent memory entries.
-            memory_entries = self.get_npc_memory(npc["npc_id"])
-            memory_summary = ""
+            # For brevity, only the last three interactions are summarized.
+            memory_entries, long_term = self._read_memory(npc["npc_id"], 3)
             if memory_entries:
-                # For brevity, summarize the last three interactions.
-                memory_summary = "\n".join(
-                    [f"- {entry.get('summary', 'No summary provided')}" for entry in memory_entries[-3:]]
+                memory_summary = "- " + "\n- ".join(
+                    entry.get("summary", "No summary provided") for entry in memory_entries
                 )
-            
-            # Build context strings.
-            location_context = f"Location: {context.get('location_name', 'Unknown')} in chunk ({context.get('q', '?')}, {context.get('r', '?')})"
-            player_history = context.get("player_history", "No significant history.")
+            else:
+                memory_summary = "No recent memories."
             
             # Build the system prompt for the AI.
-            prompt = f"""
-You are {npc['name']}, an NPC with the following personality:
-{npc['personality']}
-
-Your recent memories:
-{memory_summary if memory_summary else 'No recent memories.'}
-
-Current context:
-{location_context}
-Player history: {player_history}
-
-The player says: "{player_input}"
-Respond in character with a short, natural dialogue. If relevant, recall past interactions.
-"""
+            get = context.get
+            prompt = self._SYS_TMPL % {
+                "name": npc["name"],
+                "personality": npc["personality"],
+                "long_term": long_term or "Nothing in particular.",
+                "memories": memory_summary,
+                "loc": get("location_name", "Unknown"),
+                "q": get("q", "?"),
+                "r": get("r", "?"),
+                "hist": get("player_history", "No significant history."),
+                "inp": player_input,
+            }
             try:
-                response = self.ai.chat(
-                    model="command-r-08-2024",
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": player_input}
-                    ],
-                    temperature=0.7
-                )
-                # Assuming the response structure: response.message.content[0].text
-                npc_response = response.message.content[0].text.strip()
+                npc_response = self._chat(prompt, player_input)
             except Exception as e:
                 npc_response = "(The NPC seems confused and says nothing...)"
             
             # Update NPC memory with a summary of this interaction.
             new_memory = {
-                "timestamp": datetime.datetime.now().isoformat(),
+                "timestamp": _now_iso(),
                 "player_input": player_input,
                 "npc_response": npc_response,
                 "summary": f"Talked about '{player_input[:30]}...'"
             }
-            self.update_npc_memory(npc["npc_id"], new_memory)
-            
-            # Optionally record the conversation in the conversation_history table.
-            self.record_conversation(npc["npc_id"], 1, f"Player: {player_input}\n{npc['name']}: {npc_response}")
+            # Persist the memory and the conversation_history row together.
+            self._apply_turn(npc["npc_id"], new_memory, f"Player: {player_input}\n{npc['name']}: {npc_response}")
             
             return npc_response
         except sqlite3.Error as e:
@@ -400,18 +869,55 @@ Respond in character with a short, natural dialogue. If relevant, recall past in
         :param dialogue: A string containing both sides of the conversation.
         """
         try:
-            cur = self.db.cursor()
-            cur.execute("""
-                INSERT INTO conversation_history (npc_id, player_id, dialogue)
-                VALUES (?, ?, ?)
-            """, (npc_id, player_id, dialogue))
-            self.db.commit()
+            with _write_txn(self.db):
+                self.db.execute(self._stmts["insert_conv"], (npc_id, player_id, dialogue))
         except sqlite3.Error as e:
             logger.error(f"Database error while recording conversation: {e}", exc_info=True)
-            self.db.rollback()
         except Exception as e:
             logger.error(f"Unexpected error while recording conversation: {e}", exc_info=True)
-            self.db.rollback()
+
+    def record_conversations(self, rows: list):
+        """
+        Record several conversation exchanges at once, using a single executemany
+        and one commit instead of one commit per exchange.
+        
+        :param rows: A list of (npc_id, player_id, dialogue) tuples.
+        """
+        try:
+            with _write_txn(self.db):
+                self.db.executemany(self._stmts["insert_conv"], rows)
+        except sqlite3.Error as e:
+            logger.error(f"Database error while recording conversations: {e}", exc_info=True)
+
+    def _apply_turn(self, npc_id: int, new_memory_entry: dict, dialogue: str, player_id: int = 1):
+        """
+        Persist one conversation turn in a single transaction: the new memory entry
+        (appended in SQL, see update_npc_memory) and the conversation_history row.
+        Compaction, when due, is queued after the commit.
+        
+        :param npc_id: The ID of the NPC.
+        :param new_memory_entry: A dictionary representing the new memory entry.
+        :param dialogue: A string containing both sides of the conversation.
+        :param player_id: The player's ID (default: 1).
+        """
+        try:
+            with _write_txn(self.db):
+                length = self._append_memory(npc_id, new_memory_entry)
+                self.db.execute(self._stmts["insert_conv"], (npc_id, player_id, dialogue))
+            self._invalidate_npc(npc_id)
+            if length > MEMORY_COMPACT_AT:
+                self._schedule_compaction(npc_id)
+        except sqlite3.Error as e:
+            logger.error(f"Database error while saving conversation turn: {e}", exc_info=True)
+
+    def _invalidate_npc(self, npc_id: int):
+        """Drop any cached copies of this NPC's row after it has been written."""
+        self._npc_cache.pop(npc_id, None)
+        # list() snapshots the dict in one step, so a lookup caching a row on
+        # another thread can't change its size mid-iteration
+        stale = [key for key, (_, npc) in list(self._npc_name_cache.items()) if npc["npc_id"] == npc_id]
+        for key in stale:
+            self._npc_name_cache.pop(key, None)
 
     # ============================================================
     # Location and Spawning Management
@@ -427,20 +933,31 @@ Respond in character with a short, natural dialogue. If relevant, recall past in
         :param site_name: (Optional) The site name within the location.
         """
         try:
-            cur = self.db.cursor()
-            cur.execute("""
-                UPDATE npc 
-                SET current_q = ?, current_r = ?, location_name = ?, site_name = ?, last_interaction = ?
-                WHERE npc_id = ?
-            """, (current_q, current_r, location_name, site_name, datetime.datetime.now().isoformat(), npc_id))
-            self.db.commit()
+            with _write_txn(self.db):
+                self.db.execute(self._stmts["update_loc"],
+                                (current_q, current_r, location_name, site_name, _now_iso(), npc_id))
+            self._invalidate_npc(npc_id)
         except sqlite3.Error as e:
             logger.error(f"Database error while updating NPC location: {e}", exc_info=True)
-            self.db.rollback()
         except Exception as e:
             logger.error(f"Unexpected error while updating NPC location: {e}", exc_info=True)
-            self.db.rollback()
 
+    def update_npc_location_bulk(self, updates: list):
+        """
+        Move several NPCs at once, using a single executemany and one commit.
+        
+        :param updates: A list of (npc_id, current_q, current_r, location_name, site_name) tuples.
+        """
+        now = _now_iso()
+        try:
+            with _write_txn(self.db):
+                self.db.executemany(self._stmts["update_loc"],
+                                    [(q, r, location_name, site_name, now, npc_id)
+                                     for npc_id, q, r, location_name, site_name in updates])
+            for npc_id, *_ in updates:
+                self._invalidate_npc(npc_id)
+        except sqlite3.Error as e:
+            logger.error(f"Database error while updating NPC locations: {e}", exc_info=True)
 
 
     # ============================================================
@@ -488,19 +1005,10 @@ Respond in character with a short, natural dialogue. If relevant, recall past in
             list: A list of dictionaries containing NPC data.
         """
         try:
-            cur = self.db.cursor()
-            if site_name:
-                cur.execute(
-                    "SELECT * FROM npc WHERE current_q=? AND current_r=? AND location_name=? AND site_name=?",
-                    (q, r, location_name, site_name)
-                )
-            else:
-                cur.execute(
-                    "SELECT * FROM npc WHERE current_q=? AND current_r=? AND location_name=?",
-                    (q, r, location_name)
-                )
-            rows = cur.fetchall()
-            return [dict(row) for row in rows]
+            with self._pool.acquire() as db:
+                if site_name:
+                    return self._fetch_dicts(db, self._stmts["npcs_in_loc_site"], (q, r, location_name, site_name))
+                return self._fetch_dicts(db, self._stmts["npcs_in_loc"], (q, r, location_name))
         except sqlite3.Error as e:
             logger.error(f"Database error while getting NPCs in location: {e}", exc_info=True)
             return []
@@ -523,37 +1031,21 @@ Respond in character with a short, natural dialogue. If relevant, recall past in
             bool: True if successful, False if the team is already full or other error.
         """
         try:
-            cur = self.db.cursor()
-            cur.execute("SELECT npc_team FROM player WHERE player_id=?", (player_id,))
-            row = cur.fetchone()
-            if not row:
-                logger.error(f"Player {player_id} not found")
-                return False
-                
-            try:
-                team = json.loads(row["npc_team"]) if row["npc_team"] else []
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing team JSON for player {player_id}: {e}", exc_info=True)
-                team = []
-                
-            if len(team) >= 4:
-                logger.info(f"Team is full for player {player_id}")
-                return False
-                
-            team.append(npc_id)
-            cur.execute("UPDATE player SET npc_team=? WHERE player_id=?", (json.dumps(team), player_id))
-            cur.execute("UPDATE npc SET status=? WHERE npc_id=?", ("in_team", npc_id))
-            self.db.commit()
+            with _write_txn(self.db):
+                cur = self.db.execute(self._stmts["team_add"], (npc_id, player_id))
+                if not cur.rowcount:
+                    logger.info(f"Team is full for player {player_id} (or player not found)")
+                    return False
+                self.db.execute(self._stmts["update_status"], ("in_team", npc_id))
+            self._invalidate_npc(npc_id)
             logger.info(f"Added NPC {npc_id} to player {player_id}'s team")
             return True
             
         except sqlite3.Error as e:
             logger.error(f"Database error while adding NPC {npc_id} to team: {e}", exc_info=True)
-            self.db.rollback()
             return False
         except Exception as e:
             logger.error(f"Unexpected error while adding NPC {npc_id} to team: {e}", exc_info=True)
-            self.db.rollback()
             return False
 
     def remove_npc_from_team(self, player_id: int, npc_id: int) -> bool:
@@ -568,35 +1060,19 @@ Respond in character with a short, natural dialogue. If relevant, recall past in
             bool: True if successful, False if the NPC was not in the team or other error.
         """
         try:
-            cur = self.db.cursor()
-            cur.execute("SELECT npc_team FROM player WHERE player_id=?", (player_id,))
-            row = cur.fetchone()
-            if not row:
-                logger.error(f"Player {player_id} not found")
-                return False
-                
-            try:
-                team = json.loads(row["npc_team"]) if row["npc_team"] else []
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing team JSON for player {player_id}: {e}", exc_info=True)
-                team = []
-                
-            if npc_id not in team:
-                logger.info(f"NPC {npc_id} not in player {player_id}'s team")
-                return False
-                
-            team.remove(npc_id)
-            cur.execute("UPDATE player SET npc_team=? WHERE player_id=?", (json.dumps(team), player_id))
-            cur.execute("UPDATE npc SET status=? WHERE npc_id=?", ("active", npc_id))
-            self.db.commit()
+            with _write_txn(self.db):
+                cur = self.db.execute(self._stmts["team_remove"], (npc_id, player_id, npc_id))
+                if not cur.rowcount:
+                    logger.info(f"NPC {npc_id} not in player {player_id}'s team")
+                    return False
+                self.db.execute(self._stmts["update_status"], ("active", npc_id))
+            self._invalidate_npc(npc_id)
             logger.info(f"Removed NPC {npc_id} from player {player_id}'s team")
             return True
             
         except sqlite3.Error as e:
             logger.error(f"Database error while removing NPC {npc_id} from team: {e}", exc_info=True)
-            self.db.rollback()
             return False
         except Exception as e:
             logger.error(f"Unexpected error while removing NPC {npc_id} from team: {e}", exc_info=True)
-            self.db.rollback()
             return False
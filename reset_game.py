@@ -10,11 +10,13 @@ This script resets the game world by:
 
 import os
 import sqlite3
-import json
 import signal
 import subprocess
 from datetime import datetime
 
+from chunk_manager import chunk_rows, store_chunk_rows
+from db_utils import apply_pragmas
+
 def cleanup_python_processes():
     """Kill any existing Python processes that might be using port 8000"""
     try:
@@ -111,6 +113,56 @@ def create_tables(cur):
     )
     """)
 
+    # Create NPC memory table (one row per memory entry, oldest first by mem_id)
+    cur.execute("""
+    CREATE TABLE npc_memory (
+        mem_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        npc_id INTEGER NOT NULL,
+        ts TIMESTAMP,
+        entry TEXT,
+        FOREIGN KEY (npc_id) REFERENCES npc(npc_id)
+    )
+    """)
+    cur.execute("CREATE INDEX idx_npc_mem_npc ON npc_memory(npc_id, mem_id)")
+
+    # Create NPC long-term memory table (summaries of compacted memory entries)
+    cur.execute("""
+    CREATE TABLE npc_long_memory (
+        npc_id INTEGER PRIMARY KEY,
+        summary TEXT,
+        covers INTEGER DEFAULT 0,
+        updated TIMESTAMP,
+        FOREIGN KEY (npc_id) REFERENCES npc(npc_id)
+    )
+    """)
+
+    # Create sites table (one row per site; entities are in their own table)
+    cur.execute("""
+    CREATE TABLE sites (
+        q INTEGER,
+        r INTEGER,
+        location_name TEXT,
+        site_name TEXT,
+        discovered INTEGER,
+        description TEXT,
+        data_json TEXT,
+        PRIMARY KEY (q, r, location_name, site_name)
+    )
+    """)
+
+    # Create entities table (a site's entities, in discovery order by idx)
+    cur.execute("""
+    CREATE TABLE entities (
+        q INTEGER,
+        r INTEGER,
+        location_name TEXT,
+        site_name TEXT,
+        idx INTEGER,
+        entity_json TEXT,
+        PRIMARY KEY (q, r, location_name, site_name, idx)
+    )
+    """)
+
 def create_starting_chunk():
     """Create the initial chunk at (0,0) with a village and surrounding areas"""
     return {
@@ -200,6 +252,10 @@ def create_starting_chunk():
         }
     }
 
+# The starting chunk never changes, so it's built and serialized (into its
+# chunks/sites/entities rows) once at import
+_STARTING_CHUNK_ROWS = chunk_rows(0, 0, create_starting_chunk())
+
 def reset_game(db_path="web/game.db"):
     """Reset the game by creating a new database with initial data"""
     # Clean up any existing Python processes
@@ -209,32 +265,36 @@ def reset_game(db_path="web/game.db"):
     if os.path.exists(db_path):
         os.remove(db_path)
         print(f"Deleted existing database: {db_path}")
+    # A leftover WAL from the old database must not be replayed into the new one
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
 
     # Create new database
     db = sqlite3.connect(db_path)
     db.row_factory = sqlite3.Row
+    apply_pragmas(db)
     cur = db.cursor()
 
-    # Create tables
-    create_tables(cur)
-    print("Created new tables")
+    # Schema and starting rows go in as one transaction (one commit). An explicit
+    # BEGIN is needed because sqlite3 doesn't open a transaction for DDL itself.
+    with db:
+        cur.execute("BEGIN")
 
-    # Insert starting player
-    cur.execute("""
-    INSERT INTO player DEFAULT VALUES
-    """)
-    print("Created new player")
+        # Create tables
+        create_tables(cur)
+        print("Created new tables")
 
-    # Insert starting chunk
-    starting_chunk = create_starting_chunk()
-    cur.execute("""
-    INSERT INTO chunks (q, r, data_json)
-    VALUES (0, 0, ?)
-    """, (json.dumps(starting_chunk),))
-    print("Created starting chunk at (0,0)")
+        # Insert starting player
+        cur.execute("""
+        INSERT INTO player DEFAULT VALUES
+        """)
+        print("Created new player")
+
+        # Insert starting chunk
+        store_chunk_rows(cur, _STARTING_CHUNK_ROWS)
+        print("Created starting chunk at (0,0)")
 
-    # Commit changes and close
-    db.commit()
     db.close()
     print("Game reset complete!")
 
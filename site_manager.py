@@ -3,9 +3,170 @@
 import json
 import cohere
 import sqlite3
-from typing import Dict, Any, Optional, List
+import functools
+import hashlib
+import threading
+from typing import Dict, Any, Optional, List, Iterator
 
 from lore_rag import LoreRAG
+from chunk_manager import SQL_INSERT_SITE, SQL_INSERT_ENTITY, entity_rows, site_row, strip_sites
+from fast_json import dumps, loads
+
+
+def _one_transaction(method):
+    """
+    Run a public site action as a single transaction: the internal writers
+    (_update_chunk, _set_player_place, _apply_stat_changes) don't commit on their
+    own, and NPCManager writes inside it use a SAVEPOINT, so everything an action
+    writes is committed once at the end, or rolled back together if it raises (in
+    which case cached chunks may be ahead of the database, so they are dropped).
+    The transaction starts with the action's first write, after its Cohere call,
+    so no snapshot is held open for the AI round trip; an action whose first
+    write may be NPCManager's calls _begin() first.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            with self.db:
+                return method(self, *args, **kwargs)
+        except Exception:
+            self._chunk_cache.clear()
+            raise
+    return wrapper
+
+
+# Fixed SQL for the internal writers; the same text every time, so the
+# connection's statement cache (cached_statements) reuses the prepared statement
+_SQL_UPDATE_CHUNK = "UPDATE chunks SET data_json=? WHERE q=? AND r=?"
+_SQL_SELECT_CHUNK = "SELECT data_json FROM chunks WHERE q=? AND r=?"
+_SQL_SELECT_SITES = """
+    SELECT location_name, site_name, discovered, description, data_json
+    FROM sites WHERE q=? AND r=?
+    ORDER BY rowid
+"""
+_SQL_SELECT_ENTITIES = """
+    SELECT location_name, site_name, entity_json
+    FROM entities WHERE q=? AND r=?
+    ORDER BY location_name, site_name, idx
+"""
+_SQL_UPDATE_SITE = """
+    UPDATE sites SET discovered=?, description=?, data_json=?
+    WHERE q=? AND r=? AND location_name=? AND site_name=?
+"""
+_SQL_DELETE_ENTITIES = "DELETE FROM entities WHERE q=? AND r=? AND location_name=? AND site_name=?"
+_SQL_UPDATE_PLACE = "UPDATE player SET place_name=? WHERE player_id=?"
+_SQL_UPDATE_STATS = """
+    UPDATE player
+    SET money = MAX(money + ?, 0),
+        energy = MAX(MIN(energy + ?, 100), 0),
+        hunger = MAX(MIN(hunger + ?, 100), 0),
+        alignment = MAX(MIN(alignment + ?, 100), 0)
+    WHERE player_id=?
+    RETURNING money, energy, hunger, alignment
+"""
+
+# Constant parts of the Cohere system prompts; each call only joins in its
+# dynamic pieces instead of re-formatting the whole template
+_ACTIONS_SYSTEM_HEAD = (
+    "Based on this site description and game lore, generate 2-4 logical actions the player could take.\n"
+    "Each action should be a short verb phrase like \"buy bread\" or \"pet cat\" that is plausible in this site.\n"
+    "Keep them short and relevant.\n"
+    "\n"
+    "Site Description: "
+)
+_SEARCH_LOC_HEAD = "We have these existing sites (some discovered, some not):\n"
+_SEARCH_LOC_TAIL = """
+
+We can reveal up to 1 new site. Return JSON in the form:
+{
+  "discovery_text": "...",
+  "new_site_name": "something" or null,
+  "new_site_data": {
+     "description": "...",
+     "entities": [],
+     "history_of_events": [],
+     "discovered": true
+  }
+}
+If no new site, set new_site_name=null.
+No commentary, only JSON.
+"""
+_SEARCH_SITE_HEAD = "We have these existing entities:\n"
+_SEARCH_SITE_TAIL = """
+
+We can discover up to 1 new entity. Return JSON:
+{
+  "discovery_text": "...",
+  "new_entity": {
+    "name": "...",
+    "description": "...",
+    "history_of_events": []
+  } or null
+}
+No commentary.
+"""
+_SITE_ACTION_HEAD = (
+    "Given the site description, game lore, and chosen action, generate a BRIEF result (under 50 words) describing what happens.\n"
+    "Include key stat changes in a concise way.\n"
+    "Site Description: "
+)
+_GEN_DESC_HEAD = (
+    "Generate a descriptive text (2-3 sentences) about this site.\n"
+    "Base it on the existing site description below and the lore. \n"
+    "Existing Description: "
+)
+
+def _extract_json_object(text: str) -> Dict[str, Any]:
+    """
+    Parse the first balanced {...} object in an LLM reply, ignoring any prose
+    or code fences around it. Raises ValueError if there is no object to parse.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("no JSON object in response")
+    depth = 0
+    in_str = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                obj = loads(text[start:i + 1])
+                if not isinstance(obj, dict):
+                    raise ValueError("expected a JSON object")
+                return obj
+    raise ValueError("unterminated JSON object in response")
+
+
+# Bullet/whitespace characters trimmed from each line of a generated action list
+_ACTION_STRIP = " -\t\r"
+
+# Very simple heuristic for a site action's stat changes: each keyword found in
+# the action sets these deltas (a stat isn't counted twice when two keywords
+# share it). Energy goes up by 5 unless a keyword sets it.
+_KEYWORD_DELTAS = (
+    ("buy", {"money": -2}),
+    ("work", {"energy": -5}),
+    ("clean", {"energy": -5, "alignment": 2}),
+    ("eat", {"hunger": -10}),
+    ("meal", {"hunger": -10}),
+    ("help", {"alignment": 2}),
+)
+
+# Site types whose lore queries are pre-fetched by SiteManager.warm_lore_cache
+_COMMON_SITE_TYPES = ("inn", "smithy", "bakery", "altar", "crypt", "abandoned_watchtower")
 
 class SiteManager:
     """
@@ -19,62 +180,170 @@ class SiteManager:
         self.rag = rag
         self.npc_manager = npc_manager
 
-    def get_possible_site_actions(self, chunk_data: Dict[str, Any], location_name: str, site_name: str) -> List[str]:
-        """
-        Generate a list of possible site actions with AI, plus "search site", "leave site".
-        Called only if player is inside a site.
-        """
-        loc_obj = chunk_data["locations"].get(location_name, {})
-        site_data = loc_obj.get("sites", {}).get(site_name, {})
+        # (q, r) -> parsed chunk data, kept in step with the DB by _update_chunk
+        # (write-through), so consecutive site actions don't re-read and re-parse
+        # the chunk. Anything else that rewrites a chunk calls invalidate_chunk().
+        self._chunk_cache: Dict[tuple, Dict[str, Any]] = {}
 
-        site_description = site_data.get("description", "")
-        # fallback: check location history if no direct description
-        if not site_description and "history_of_events" in loc_obj:
-            for event in loc_obj["history_of_events"]:
-                if site_name in event.lower():
-                    site_description = event
-                    break
+        # query -> joined lore text. Per instance (not a decorator on the method),
+        # so the cache doesn't hold every SiteManager alive.
+        self._cached_query_lore = functools.lru_cache(maxsize=256)(self._query_lore_text)
 
-        # Query RAG for lore about this site type
-        lore_docs = self.rag.query_lore(f"What are common activities and interactions in a {site_name}?")
-        lore_context = "\n".join(d["data"]["content"] for d in lore_docs)
+        self.ensure_tables()
 
-        system_prompt = f"""Based on this site description and game lore, generate 2-4 logical actions the player could take.
-Each action should be a short verb phrase like "buy bread" or "pet cat" that is plausible in this site.
-Keep them short and relevant.
+        # (site_name, blake2b(site description)) -> generated action list. The key
+        # changes whenever the description does, so stale entries are never hit;
+        # do_enter_site also drops them when it rewrites a description.
+        self._site_actions_cache: Dict[tuple, List[str]] = {}
+        # Held by every write to it (request threads and the action stream);
+        # lookups are plain .get()s
+        self._site_actions_lock = threading.Lock()
 
-Site Description: {site_description}
+    def ensure_tables(self):
+        """
+        Create the sites / entities tables on databases created before they
+        existed, and move any sites still stored inside chunk blobs into them
+        (entities keep their list order as idx). Chunk rows that aren't valid
+        JSON are left alone, to fail only when that chunk is loaded.
+        """
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sites (
+                q INTEGER,
+                r INTEGER,
+                location_name TEXT,
+                site_name TEXT,
+                discovered INTEGER,
+                description TEXT,
+                data_json TEXT,
+                PRIMARY KEY (q, r, location_name, site_name)
+            );
+            CREATE TABLE IF NOT EXISTS entities (
+                q INTEGER,
+                r INTEGER,
+                location_name TEXT,
+                site_name TEXT,
+                idx INTEGER,
+                entity_json TEXT,
+                PRIMARY KEY (q, r, location_name, site_name, idx)
+            );
+
+            BEGIN;
+            INSERT OR IGNORE INTO sites (q, r, location_name, site_name, discovered, description, data_json)
+                SELECT c.q, c.r, l.key, s.key, json_extract(s.value, '$.discovered'),
+                       json_extract(s.value, '$.description'),
+                       json_remove(s.value, '$.discovered', '$.description', '$.entities')
+                FROM chunks c, json_each(c.data_json, '$.locations') l, json_each(l.value, '$.sites') s
+                WHERE json_valid(c.data_json);
+            INSERT OR IGNORE INTO entities (q, r, location_name, site_name, idx, entity_json)
+                SELECT c.q, c.r, l.key, s.key, e.key, json_quote(e.value)
+                FROM chunks c, json_each(c.data_json, '$.locations') l, json_each(l.value, '$.sites') s,
+                     json_each(s.value, '$.entities') e
+                WHERE json_valid(c.data_json);
+            UPDATE chunks SET data_json = json_set(data_json, '$.locations', json((
+                    SELECT json_group_object(l.key, json_remove(l.value, '$.sites'))
+                    FROM json_each(chunks.data_json, '$.locations') l)))
+                WHERE CASE WHEN json_valid(data_json) THEN
+                          EXISTS (SELECT 1 FROM json_each(data_json, '$.locations') l
+                                  WHERE json_type(l.value, '$.sites') IS NOT NULL) END;
+            COMMIT;
+        """)
+
+    def get_chunk(self, q: int, r: int) -> Optional[Dict[str, Any]]:
+        """
+        Return the parsed data of an existing chunk, from the cache when possible.
+        The dict is the cached object itself, with each location's "sites" filled
+        in from the sites / entities tables; write changes back with _update_chunk
+        (location fields) or _update_site / _insert_site / _add_entity (sites).
+        
+        :return: The chunk data, or None if the chunk hasn't been generated yet.
+        """
+        chunk = self._chunk_cache.get((q, r))
+        if chunk is None:
+            row = self.db.execute(_SQL_SELECT_CHUNK, (q, r)).fetchone()
+            if row is None:
+                return None
+            chunk = self._chunk_cache.setdefault((q, r), self._load_sites(q, r, loads(row[0])))
+        return chunk
+
+    def invalidate_chunk(self, q: int, r: int):
+        """Forget the cached copy of a chunk that was changed outside SiteManager."""
+        self._chunk_cache.pop((q, r), None)
 
-Relevant Game Lore:
-{lore_context}
-"""
+    def get_possible_site_actions(self, chunk_data: Dict[str, Any], location_name: str, site_name: str) -> List[str]:
+        """
+        Generate a list of possible site actions with AI, plus "search site", "leave site".
+        Called only if player is inside a site.
+        """
+        key, site_description = self._site_actions_key(chunk_data, location_name, site_name)
+        cached = self._site_actions_cache.get(key)
+        if cached is not None:
+            return list(cached)
 
         try:
             response = self.ai.chat(
                 model="command-r-08-2024",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": "What actions are possible here?"}
-                ],
+                messages=self._site_actions_messages(site_name, site_description),
                 temperature=0.7
             )
 
-            raw_lines = response.message.content[0].text.strip().split('\n')
-            actions = []
-            for line in raw_lines:
-                line = line.strip("- ").strip()
-                if line:
-                    # keep short lines
-                    if len(line.split()) <= 4:
-                        actions.append(line.lower())
+            actions = [
+                action
+                for action in map(self._parse_action_line, response.message.content[0].text.split('\n'))
+                if action
+            ]
             if not actions:
                 actions = ["look around"]
+            else:
+                self._remember_site_actions(key, actions)
             return actions
 
         except Exception as e:
             print(f"Error generating site actions: {e}")
             return ["look around"]
 
+    def iter_site_actions(self, chunk_data: Dict[str, Any], location_name: str, site_name: str) -> Iterator[str]:
+        """
+        Streaming version of get_possible_site_actions: yields each action as soon as
+        its line has arrived from Cohere instead of waiting for the whole reply.
+        Cached action lists are yielded straight away.
+        """
+        key, site_description = self._site_actions_key(chunk_data, location_name, site_name)
+        cached = self._site_actions_cache.get(key)
+        if cached is not None:
+            yield from list(cached)
+            return
+
+        actions = []
+        try:
+            stream = self.ai.chat_stream(
+                model="command-r-08-2024",
+                messages=self._site_actions_messages(site_name, site_description),
+                temperature=0.7
+            )
+            buf = ""
+            for event in stream:
+                if event.type != "content-delta":
+                    continue
+                buf += event.delta.message.content.text
+                *lines, buf = buf.split("\n")
+                for line in lines:
+                    action = self._parse_action_line(line)
+                    if action:
+                        actions.append(action)
+                        yield action
+            action = self._parse_action_line(buf)
+            if action:
+                actions.append(action)
+                yield action
+        except Exception as e:
+            print(f"Error streaming site actions: {e}")
+
+        if actions:
+            self._remember_site_actions(key, actions)
+        else:
+            yield "look around"
+
+    @_one_transaction
     def do_enter_site(self, p: Dict[str, Any], chunk_data: Dict[str, Any], site_name: str) -> str:
         """
         Enter a site in the current location, if discovered.
@@ -92,12 +361,19 @@ Relevant Game Lore:
 
         # Update site desc if the new one is more detailed
         if len(new_desc) > len(base_desc):
+            self._forget_site_actions(site_name)
             sites[site_name]["description"] = new_desc
-            chunk_data["locations"][p["location_name"]]["sites"] = sites
-            self._update_chunk(p["q"], p["r"], chunk_data)
+            self._update_site(p["q"], p["r"], p["location_name"], site_name, sites[site_name])
+
+        # The description is settled; from here on everything is one transaction,
+        # including a spawned NPC's row
+        self._begin()
 
-        # Check if an NPC is already present in this site
+        # Check if an NPC is already present in this site. A failed NPC lookup
+        # or spawn only loses the encounter; the site and player writes below
+        # are left to raise, so the whole action rolls back.
         npc = None
+        spawned = False
         try:
             if "npc_id" in sites[site_name]:
                 npc = self.npc_manager.get_npc_by_id(sites[site_name]["npc_id"])
@@ -107,30 +383,33 @@ Relevant Game Lore:
             if not npc:  # No existing NPC or reference was invalid
                 # Use NPC manager to check for an NPC at the site
                 npc = self.npc_manager.spawn_npc(p["q"], p["r"], p["location_name"], site_name)
-                if npc and "npc_id" in npc:
-                    # Store only the NPC's ID inside the site data
-                    sites[site_name]["npc_id"] = npc["npc_id"]
-                    # Update the chunk data with site info
-                    chunk_data["locations"][p["location_name"]]["sites"] = sites
-                    self._update_chunk(p["q"], p["r"], chunk_data)
-
-            # Update the player's current site
-            self._set_player_place(p["player_id"], site_name)
-
-            # Prepare the encounter message if an NPC was encountered
-            encounter_msg = ""
-            if npc and "name" in npc:
-                encounter_msg = f" You notice {npc['name']} here."
+                spawned = bool(npc and "npc_id" in npc)
         except Exception as e:
-            logger.error(f"Error handling NPC in site: {e}", exc_info=True)
-            encounter_msg = ""  # Suppress NPC message on error
+            print(f"Error handling NPC in site: {e}")
+            npc = None
+
+        if spawned:
+            # Store only the NPC's ID inside the site data
+            sites[site_name]["npc_id"] = npc["npc_id"]
+            # Update the site row with the NPC reference
+            self._update_site(p["q"], p["r"], p["location_name"], site_name, sites[site_name])
+
+        # Update the player's current site
+        self._set_player_place(p["player_id"], site_name)
+
+        # Prepare the encounter message if an NPC was encountered
+        encounter_msg = ""
+        if npc and "name" in npc:
+            encounter_msg = f" You notice {npc['name']} here."
 
         return f"You enter the {site_name}. {new_desc}{encounter_msg}"
 
+    @_one_transaction
     def do_leave_site(self, p: Dict[str, Any]) -> str:
         self._set_player_place(p["player_id"], None)
         return "You step out of the site, back to the main location."
 
+    @_one_transaction
     def do_search_location_for_new_site(self, p: Dict[str, Any], chunk_data: Dict[str, Any]) -> str:
         """
         Searching a location might reveal up to 1 new site. We'll call Cohere to see if we find anything new.
@@ -143,25 +422,10 @@ Relevant Game Lore:
             return "You've discovered everything here. No more new discoveries."
 
         # build system prompt
-        system_prompt = f"""
-We are searching the location '{loc_name}'.
-We have these existing sites (some discovered, some not):
-{json.dumps(sites, indent=2)}
-
-We can reveal up to 1 new site. Return JSON in the form:
-{{
-  "discovery_text": "...",
-  "new_site_name": "something" or null,
-  "new_site_data": {{
-     "description": "...",
-     "entities": [],
-     "history_of_events": [],
-     "discovered": true
-  }}
-}}
-If no new site, set new_site_name=null.
-No commentary, only JSON.
-"""
+        system_prompt = "".join((
+            "\nWe are searching the location '", loc_name, "'.\n",
+            _SEARCH_LOC_HEAD, json.dumps(sites, indent=2), _SEARCH_LOC_TAIL,
+        ))
         user_prompt = "The player searches around to see if they find a new site."
 
         try:
@@ -173,7 +437,7 @@ No commentary, only JSON.
                 ]
             )
             raw = response.message.content[0].text.strip()
-            data = json.loads(raw)
+            data = _extract_json_object(raw)
         except:
             data = {
                 "discovery_text": "You find nothing special.",
@@ -192,11 +456,14 @@ No commentary, only JSON.
             loc_obj["history_of_events"].append(f"Found new site: {new_name}")
 
             chunk_data["locations"][loc_name] = loc_obj
+            self._insert_site(p["q"], p["r"], loc_name, new_name, new_data)
+            # the location's history lives in the chunk row
             self._update_chunk(p["q"], p["r"], chunk_data)
             return f"You search the {loc_name}... {disc_text}"
         else:
             return f"You search around but: {disc_text}"
 
+    @_one_transaction
     def do_search_site(self, p: Dict[str, Any], chunk_data: Dict[str, Any]) -> str:
         """
         Searching inside a site might reveal up to 1 new entity.
@@ -213,22 +480,10 @@ No commentary, only JSON.
         if len(existing_ents) >= 100:
             return "This site is already crowded. No more new discoveries."
 
-        system_prompt = f"""
-We are searching inside site '{site_name}' at location '{loc_name}'.
-We have these existing entities:
-{json.dumps(existing_ents, indent=2)}
-
-We can discover up to 1 new entity. Return JSON:
-{{
-  "discovery_text": "...",
-  "new_entity": {{
-    "name": "...",
-    "description": "...",
-    "history_of_events": []
-  }} or null
-}}
-No commentary.
-"""
+        system_prompt = "".join((
+            "\nWe are searching inside site '", site_name, "' at location '", loc_name, "'.\n",
+            _SEARCH_SITE_HEAD, json.dumps(existing_ents, indent=2), _SEARCH_SITE_TAIL,
+        ))
         user_prompt = "The player inspects the site thoroughly for items or NPCs."
 
         try:
@@ -240,7 +495,7 @@ No commentary.
                 ]
             )
             raw = resp.message.content[0].text.strip()
-            data = json.loads(raw)
+            data = _extract_json_object(raw)
         except:
             data = {
                 "discovery_text": "Nothing new to find.",
@@ -256,15 +511,14 @@ No commentary.
             site_data.setdefault("history_of_events", [])
             site_data["history_of_events"].append(f"New entity discovered: {new_ent['name']}")
 
-            sites[site_name] = site_data
-            loc_obj["sites"] = sites
-            chunk_data["locations"][loc_name] = loc_obj
-
-            self._update_chunk(p["q"], p["r"], chunk_data)
+            # Only this site's row and the new entity are written, not the chunk
+            self._update_site(p["q"], p["r"], loc_name, site_name, site_data)
+            self._add_entity(p["q"], p["r"], loc_name, site_name, len(existing_ents) - 1, new_ent)
             return f"You search {site_name}: {disc_text}"
         else:
             return f"You search {site_name}... {disc_text}"
 
+    @_one_transaction
     def handle_site_action(self, p: Dict[str, Any], chunk_data: Dict[str, Any], site_name: str, chosen_action: str) -> str:
         """
         Perform a site-specific custom action. Use RAG + AI to generate a result and
@@ -276,19 +530,14 @@ No commentary.
 
         # Query lore about this specific action
         lore_query = f"What happens when someone {chosen_action} in a {site_name}? Effects?"
-        lore_docs = self.rag.query_lore(lore_query)
-        lore_context = "\n".join(d["data"]["content"] for d in lore_docs)
-
-        system_prompt = f"""Given the site description, game lore, and chosen action, generate a BRIEF result (under 50 words) describing what happens.
-Include key stat changes in a concise way.
-Site Description: {site_description}
+        lore_context = self._cached_query_lore(lore_query)
 
-Relevant Game Lore:
-{lore_context}
-
-Chosen Action: {chosen_action}
-Current Stats: (We will parse changes ourselves)
-"""
+        system_prompt = "".join((
+            _SITE_ACTION_HEAD, site_description,
+            "\n\nRelevant Game Lore:\n", lore_context,
+            "\n\nChosen Action: ", chosen_action,
+            "\nCurrent Stats: (We will parse changes ourselves)\n",
+        ))
 
         try:
             resp = self.ai.chat(
@@ -301,37 +550,120 @@ Current Stats: (We will parse changes ourselves)
                 max_tokens=100
             )
             result_text = resp.message.content[0].text.strip()
-
-            # Very simple heuristic
-            stat_changes = {
-                "money": -2 if "buy" in chosen_action else 0,
-                "energy": -5 if "work" in chosen_action or "clean" in chosen_action else 5,
-                "hunger": -10 if "eat" in chosen_action or "meal" in chosen_action else 0,
-                "alignment": 2 if "help" in chosen_action or "clean" in chosen_action else 0
-            }
-            self._apply_stat_changes(p["player_id"], stat_changes)
-            return result_text
         except Exception as e:
             print(f"Error in handle_site_action: {e}")
             return f"You {chosen_action}, but nothing special seems to happen."
 
+        # Very simple heuristic (see _KEYWORD_DELTAS). A failed write raises, so
+        # _one_transaction rolls the action back rather than committing half of it.
+        stat_changes = {"energy": 5}
+        for keyword, deltas in _KEYWORD_DELTAS:
+            if keyword in chosen_action:
+                stat_changes.update(deltas)
+        self._apply_stat_changes(p["player_id"], stat_changes)
+        return result_text
+
     # ------------------------------------------------------------------------
     # Internals
     # ------------------------------------------------------------------------
+    def _begin(self):
+        """Open the action's transaction now, if no write has opened it yet (see _one_transaction)."""
+        if not self.db.in_transaction:
+            self.db.execute("BEGIN")
+
+    def _query_lore_text(self, query: str) -> str:
+        """
+        Retrieve lore for a query as one newline-joined string. Called through
+        self._cached_query_lore, so a repeated query skips the embed + vector search.
+        """
+        lore_docs = self.rag.query_lore(query)
+        return "\n".join(d["data"]["content"] for d in lore_docs)
+
+    def _site_actions_key(self, chunk_data: Dict[str, Any], location_name: str, site_name: str):
+        """
+        Resolve the description the action list is generated from, and its cache key.
+        
+        :return: A ((site_name, description digest), description) tuple.
+        """
+        loc_obj = chunk_data["locations"].get(location_name, {})
+        site_data = loc_obj.get("sites", {}).get(site_name, {})
+
+        site_description = site_data.get("description", "")
+        # fallback: check location history if no direct description
+        if not site_description and "history_of_events" in loc_obj:
+            for event in loc_obj["history_of_events"]:
+                if site_name in event.lower():
+                    site_description = event
+                    break
+
+        key = (site_name, hashlib.blake2b(site_description.encode(), digest_size=16).digest())
+        return key, site_description
+
+    def _site_actions_messages(self, site_name: str, site_description: str) -> List[Dict[str, str]]:
+        """Build the chat messages that ask Cohere for a site's actions."""
+        # Query RAG for lore about this site type
+        lore_context = self._cached_query_lore(f"What are common activities and interactions in a {site_name}?")
+
+        system_prompt = "".join((
+            _ACTIONS_SYSTEM_HEAD, site_description,
+            "\n\nRelevant Game Lore:\n", lore_context, "\n",
+        ))
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": "What actions are possible here?"}
+        ]
+
+    @staticmethod
+    def _parse_action_line(line: str) -> Optional[str]:
+        """Turn one line of the model's reply into an action, or None if it isn't one."""
+        line = line.strip(_ACTION_STRIP)
+        # keep short lines (at most 4 words)
+        if line and line.count(' ') <= 3:
+            return line.lower()
+        return None
+
+    def _remember_site_actions(self, key: tuple, actions: List[str]):
+        with self._site_actions_lock:
+            if len(self._site_actions_cache) >= 512:
+                self._site_actions_cache.pop(next(iter(self._site_actions_cache)), None)
+            self._site_actions_cache[key] = list(actions)
+
+    def _forget_site_actions(self, site_name: str):
+        """Drop cached action lists for a site whose description is being replaced."""
+        with self._site_actions_lock:
+            for key in [k for k in self._site_actions_cache if k[0] == site_name]:
+                del self._site_actions_cache[key]
+
+    def warm_lore_cache(self) -> threading.Thread:
+        """
+        Pre-fetch the lore queries for the most common site types on a background
+        thread and return it. Opt-in, so scripts and tests that only construct a
+        SiteManager don't query the lore store; the web server calls it at startup.
+        """
+        thread = threading.Thread(target=self._warm_lore_cache, name="lore-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_lore_cache(self):
+        """Body of warm_lore_cache's background thread."""
+        for site_name in _COMMON_SITE_TYPES:
+            try:
+                self._cached_query_lore(f"What are common activities and interactions in a {site_name}?")
+                self._cached_query_lore(f"Tell me about {site_name}s in this world. ")
+            except Exception as e:
+                print(f"Error warming lore cache: {e}")
+                return
+
     def _generate_site_description(self, site_name: str, base_description: str) -> str:
         """
         Ask AI to produce an atmospheric site description based on the base description and lore.
         """
-        lore_docs = self.rag.query_lore(f"Tell me about {site_name}s in this world. ")
-        lore_context = "\n".join(d["data"]["content"] for d in lore_docs)
+        lore_context = self._cached_query_lore(f"Tell me about {site_name}s in this world. ")
 
-        system_prompt = f"""Generate a descriptive text (2-3 sentences) about this site.
-Base it on the existing site description below and the lore. 
-Existing Description: {base_description}
-
-Relevant Lore:
-{lore_context}
-"""
+        system_prompt = "".join((
+            _GEN_DESC_HEAD, base_description,
+            "\n\nRelevant Lore:\n", lore_context, "\n",
+        ))
 
         try:
             resp = self.ai.chat(
@@ -347,46 +679,56 @@ Relevant Lore:
             print(f"Error generating site desc: {e}")
             return base_description
 
+    def _load_sites(self, q: int, r: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill each location's "sites" in a chunk read from the chunks row."""
+        locations = chunk.setdefault("locations", {})
+        for loc in locations.values():
+            loc.setdefault("sites", {})
+        cur = self.db.cursor()
+        cur.row_factory = None
+        for loc_name, site_name, discovered, description, extras in cur.execute(_SQL_SELECT_SITES, (q, r)):
+            site = loads(extras) if extras else {}
+            if description is not None:
+                site["description"] = description
+            if discovered is not None:
+                site["discovered"] = bool(discovered)
+            site["entities"] = []
+            locations.setdefault(loc_name, {"sites": {}})["sites"][site_name] = site
+        for loc_name, site_name, entity in cur.execute(_SQL_SELECT_ENTITIES, (q, r)):
+            site = locations.get(loc_name, {}).get("sites", {}).get(site_name)
+            if site is not None:
+                site["entities"].append(loads(entity))
+        return chunk
+
     def _update_chunk(self, q: int, r: int, new_data: Dict[str, Any]):
-        self.db.execute('BEGIN TRANSACTION')
-        try:
-            c = self.db.cursor()
-            c.execute("UPDATE chunks SET data_json=? WHERE q=? AND r=?", (json.dumps(new_data), q, r))
-            self.db.commit()
-        except Exception as e:
-            self.db.rollback()
-            raise e
+        """Write a chunk's location-level data; sites are written separately."""
+        self._chunk_cache[(q, r)] = new_data
+        self.db.execute(_SQL_UPDATE_CHUNK, (dumps(strip_sites(new_data)), q, r))
+
+    def _update_site(self, q: int, r: int, location_name: str, site_name: str, site: Dict[str, Any]):
+        """Rewrite one site's row (not its entities) from its dict in the cached chunk."""
+        row = site_row(q, r, location_name, site_name, site)
+        self.db.execute(_SQL_UPDATE_SITE, row[4:] + row[:4])
+
+    def _insert_site(self, q: int, r: int, location_name: str, site_name: str, site: Dict[str, Any]):
+        """Store a newly discovered site and its entities, replacing any old ones of that name."""
+        key = (q, r, location_name, site_name)
+        self.db.execute(_SQL_DELETE_ENTITIES, key)
+        self.db.execute(SQL_INSERT_SITE, site_row(*key, site))
+        self.db.executemany(SQL_INSERT_ENTITY, entity_rows(*key, site.get("entities", [])))
+
+    def _add_entity(self, q: int, r: int, location_name: str, site_name: str, idx: int, entity: Dict[str, Any]):
+        self.db.execute(SQL_INSERT_ENTITY, (q, r, location_name, site_name, idx, dumps(entity)))
 
     def _set_player_place(self, player_id: int, place_name: Optional[str]):
-        self.db.execute('BEGIN TRANSACTION')
-        try:
-            c = self.db.cursor()
-            c.execute("UPDATE player SET place_name=? WHERE player_id=?", (place_name, player_id))
-            self.db.commit()
-        except Exception as e:
-            self.db.rollback()
-            raise e
+        self.db.execute(_SQL_UPDATE_PLACE, (place_name, player_id))
 
-    def _apply_stat_changes(self, player_id: int, changes: Dict[str, int]):
-        self.db.execute('BEGIN TRANSACTION')
-        try:
-            c = self.db.cursor()
-            row = c.execute("SELECT money, energy, hunger, alignment FROM player WHERE player_id=?", (player_id,)).fetchone()
-            if row:
-                money = max(row["money"] + changes.get("money", 0), 0)
-                energy = row["energy"] + changes.get("energy", 0)
-                energy = max(min(energy, 100), 0)
-                hunger = row["hunger"] + changes.get("hunger", 0)
-                hunger = max(min(hunger, 100), 0)
-                alignment = row["alignment"] + changes.get("alignment", 0)
-                alignment = max(min(alignment, 100), 0)
-
-                c.execute("""
-                    UPDATE player
-                    SET money=?, energy=?, hunger=?, alignment=?
-                    WHERE player_id=?
-                """, (money, energy, hunger, alignment, player_id))
-                self.db.commit()
-        except Exception as e:
-            self.db.rollback()
-            raise e
+    def _apply_stat_changes(self, player_id: int, changes: Dict[str, int]) -> Optional[sqlite3.Row]:
+        """
+        Apply stat deltas with clamping (money >= 0, the rest within 0..100) in one
+        UPDATE, and return the resulting stats (None if the player doesn't exist).
+        """
+        return self.db.execute(_SQL_UPDATE_STATS, (
+            changes.get("money", 0), changes.get("energy", 0),
+            changes.get("hunger", 0), changes.get("alignment", 0), player_id,
+        )).fetchone()
@@ -8,6 +8,8 @@ Useful if you want to see debug info without running the full CLI.
 
 from hex_game_engine import HexGameEngine
 
+MONTH_NAMES = ("Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec")
+
 def test_game():
     engine = HexGameEngine(db_path="game.db")
 
@@ -20,8 +22,7 @@ def test_game():
         print(f"Alignment: {p['alignment']}/100")
         ### TIME FEATURE ADDED ###
         # Convert month to string if you like, or just show numeric
-        month_names = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-        month_str = month_names[(p['time_month']-1) % 12]
+        month_str = MONTH_NAMES[(p['time_month']-1) % 12]
         print(f"Time: Year {p['time_year']} AC, {month_str} {p['time_day']}th, {p['time_hour']}:00")
         print(f"Location: {p['location_name']} at ({p['q']}, {p['r']})")
         if p['place_name']:
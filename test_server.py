@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+test_server.py
+
+Checks that the web server answers revalidations with a 304 when the body is
+compressed: Flask-Compress sends the ETag back as "<etag>:br", and that is the
+tag the browser puts in If-None-Match.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "web"))
+import server
+
+def revalidate(client, path):
+    headers = {"Accept-Encoding": "br"}
+    resp = client.get(path, headers=headers)
+    resp.get_data()
+    etag = resp.headers["ETag"]
+    print(f"{path}: {resp.status_code}, {resp.headers.get('Content-Encoding')}, ETag {etag}")
+    assert resp.status_code == 200
+
+    resp = client.get(path, headers={**headers, "If-None-Match": etag})
+    resp.get_data()
+    print(f"  revalidated: {resp.status_code}")
+    assert resp.status_code == 304
+
+def test_server():
+    client = server.app.test_client()
+    revalidate(client, "/")
+    revalidate(client, "/api/get_player_state")
+
+if __name__ == "__main__":
+    test_server()
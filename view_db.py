@@ -2,6 +2,8 @@
 import sqlite3
 import json
 
+from fast_json import loads
+
 def view_database():
     # Connect to the database
     conn = sqlite3.connect("game.db")
@@ -11,18 +13,41 @@ def view_database():
     # View player table
     print("\n=== Player Table ===")
     cursor.execute("SELECT * FROM player")
-    for row in cursor.fetchall():
+    for row in cursor:
         print(dict(row))
     
-    # View chunks table
+    # View chunks table. Rows are streamed (arraysize at a time) instead of
+    # fetchall(), so only a batch of data_json blobs is held in memory at once.
     print("\n=== Chunks Table ===")
-    cursor.execute("SELECT * FROM chunks")
-    for row in cursor.fetchall():
-        chunk = dict(row)
+    cursor.arraysize = 64
+    cursor.execute("SELECT q, r, data_json FROM chunks")
+    dumps = json.dumps
+    for row in cursor:
+        raw = row['data_json']
+        print(f"\nChunk at (q={row['q']}, r={row['r']}):")
         # Pretty print the JSON data
-        chunk['data_json'] = json.loads(chunk['data_json'])
-        print(f"\nChunk at (q={chunk['q']}, r={chunk['r']}):")
-        print(json.dumps(chunk['data_json'], indent=2))
+        print(dumps(loads(raw), indent=2))
+    
+    # Sites and their entities live in their own tables, not in data_json
+    print("\n=== Sites Table ===")
+    cursor.execute("""
+        SELECT q, r, location_name, site_name, discovered, description, data_json
+        FROM sites ORDER BY q, r, location_name, rowid
+    """)
+    for row in cursor:
+        site = dict(row)
+        site["data_json"] = loads(site["data_json"]) if site["data_json"] else {}
+        print(dumps(site, indent=2))
+    
+    print("\n=== Entities Table ===")
+    cursor.execute("""
+        SELECT q, r, location_name, site_name, idx, entity_json
+        FROM entities ORDER BY q, r, location_name, site_name, idx
+    """)
+    for row in cursor:
+        entity = dict(row)
+        entity["entity_json"] = loads(entity["entity_json"])
+        print(dumps(entity, indent=2))
     
     conn.close()
 
@@ -1,6 +1,9 @@
 # server.py
-import sys, os, json
-from flask import Flask, request, jsonify, send_from_directory, current_app
+import sys, os, json, hashlib, threading, atexit
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, current_app, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 
 # Update Python path if needed...
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -8,106 +11,338 @@ parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
 sys.path.insert(0, parent_dir)
 
 from game_engine import GameEngine
+from fast_json import orjson
+
+MONTH_NAMES = ("Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec")
+# time_month -> name; the engine keeps time_month within 1..12
+_MONTH_BY_INT = dict(enumerate(MONTH_NAMES, 1))
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify() / request.get_json() through orjson instead of the stdlib json module."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
+if orjson is not None:
+    app.json_provider_class = OrjsonProvider
+    app.json = OrjsonProvider(app)
+
+def _dumpb(obj) -> bytes:
+    """Encode obj to JSON bytes with app.json's settings (straight from orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=app.json.default, option=orjson.OPT_NON_STR_KEYS)
+    return app.json.dumps(obj).encode()
+
+def ojson(obj, status=200):
+    """A JSON response without jsonify()'s str round trip."""
+    return Response(_dumpb(obj), status=status, mimetype="application/json")
+
+# Brotli/gzip for JSON responses of a useful size (chunk data compresses well).
+# The actions event stream isn't in the mimetype list, so it is never buffered.
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 256
+app.config["COMPRESS_MIMETYPES"] = ["application/json", "text/html", "text/css", "application/javascript"]
+# Quality 4 for both: most of the size win for a fraction of the CPU of the
+# higher levels.
+app.config["COMPRESS_BR_LEVEL"] = 4
+app.config["COMPRESS_LEVEL"] = 4
+# Streamed responses (map_data) are compressed chunk by chunk as they are sent
+# (flask-compress >= 1.22; older versions buffered the whole body first). gzip
+# can't be used for streams there; clients accepting neither br nor deflate
+# get the stream uncompressed.
+app.config["COMPRESS_STREAMS"] = True
+app.config["COMPRESS_ALGORITHM_STREAMING"] = ["br", "deflate"]
+Compress(app)
 engine = GameEngine(db_path="game.db")
+engine.site_manager.warm_lore_cache()
+atexit.register(engine.close)
+
+@app.teardown_request
+def _release_db(exc):
+    # Return the request's SQLite connection to the engine's pool (after a
+    # streamed response, once its generator has finished)
+    engine.db.release()
+
+# Player state only changes through apply_action, which bumps _state_version.
+# get_player_state keeps the encoded body of the version it last built as
+# (version, etag, body) and reuses it until the next action. _state_lock
+# guards _state_version, _state_cache and _actions_future below.
+_state_version = 0
+_state_lock = threading.Lock()
+_state_cache = (-1, None, None)
+
+# After an action the frontend asks for the new state and actions straight
+# away, so both are computed in the background as soon as the action is done.
+# The actions are kept as (version, future): a GET that arrives while they are
+# still being generated waits on that future instead of asking Cohere again.
+_prefetch = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+_actions_future = (-1, None)
+
+# map_data SQL, kept as constants so every request hands sqlite3 the same text
+# and hits the connection's prepared-statement cache
+_MAP_WHERE = " WHERE q BETWEEN ? AND ? AND r BETWEEN ? AND ?"
+_MAP_VERSION_SQL = "SELECT version FROM map_version"
+_MAP_SQL = "SELECT q, r, data_json FROM chunks" + _MAP_WHERE + " AND json_valid(data_json)"
+
+# Default map_data window: this many chunks either side of the player
+_MAP_RADIUS = 16
+# map_data yields its body in pieces of about this size
+_MAP_BATCH_BYTES = 64 * 1024
+
+def _bump_state_version():
+    global _state_version
+    with _state_lock:
+        _state_version += 1
+        return _state_version
+
+def _prefetch_after_action(version):
+    """Start building the state and actions for a new state version."""
+    global _actions_future
+    with _state_lock:
+        # two actions finishing close together may get here out of order
+        if version > _actions_future[0]:
+            _actions_future = (version, _prefetch.submit(_prefetch_task, engine.get_possible_actions))
+    _prefetch.submit(_prefetch_task, _prefetch_player_state, version)
+
+def _prefetch_task(fn, *args):
+    """Run fn on a prefetch thread, then hand its connection back to the pool."""
+    try:
+        return fn(*args)
+    finally:
+        engine.db.release()
+
+def _not_modified(etag):
+    """
+    A 304 for etag if the request's If-None-Match names it, else None.
+    Flask-Compress tags a compressed body as "<etag>:<algorithm>" and that is
+    what the browser sends back, so the suffix is ignored when comparing.
+    """
+    for tag in request.if_none_match:
+        if tag == etag or tag.rpartition(":")[0] == etag:
+            return Response(status=304, headers={"ETag": f'"{tag}"'})
+    return None
+
+def _prefetch_player_state(version):
+    global _state_cache
+    try:
+        with _state_lock:
+            # skip it if a request already built it, or another action made it stale
+            if _state_cache[0] != version and version == _state_version:
+                _state_cache = (version, *_build_player_state())
+    except Exception:
+        app.logger.exception("Error prefetching player state")
+
+# index.html doesn't change while the server runs: read it once and answer
+# revalidations (If-None-Match) with a 304
+with open(os.path.join(current_dir, "static", "index.html"), "rb") as f:
+    _INDEX_BYTES = f.read()
+_INDEX_ETAG = hashlib.blake2b(_INDEX_BYTES, digest_size=16).hexdigest()
 
 @app.route("/")
 def index():
-    return send_from_directory("static", "index.html")
+    not_modified = _not_modified(_INDEX_ETAG)
+    if not_modified is not None:
+        return not_modified
+    resp = Response(_INDEX_BYTES, mimetype="text/html")
+    resp.set_etag(_INDEX_ETAG)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def _current_player_state():
+    """(etag, body) of the player state, rebuilt only if an action happened since."""
+    global _state_cache
+    with _state_lock:
+        version, etag, body = _state_cache
+        if version != _state_version:
+            version = _state_version
+            etag, body = _build_player_state()
+            _state_cache = (version, etag, body)
+        return etag, body
+
+def _current_actions():
+    """The possible actions, taken from the post-action prefetch when it is current."""
+    with _state_lock:
+        version, future = _actions_future
+        current = version == _state_version
+    if current:
+        # waited on outside the lock, which other requests need meanwhile
+        try:
+            return future.result()
+        except Exception:
+            current_app.logger.exception("Prefetched actions failed; generating them again")
+    return engine.get_possible_actions()
+
+def _build_player_state():
+    """Encode the current player state; returns (etag, body bytes)."""
+    p = engine.get_player_state()
+
+    # engine.get_player_state() builds a fresh dict per call, so it is sent as
+    # is, with the month number swapped for its name
+    p["time_month_str"] = _MONTH_BY_INT[p.pop("time_month")]
+    body = _dumpb(p)
+    return hashlib.blake2b(body, digest_size=16).hexdigest(), body
 
 @app.route("/api/get_player_state", methods=["GET"])
 def get_player_state():
     try:
-        p = engine.get_player_state()
-
-        # Convert month numeric -> string if you wish
-        month_names = ["Jan","Feb","Mar","Apr","May","Jun","Jul","Aug","Sep","Oct","Nov","Dec"]
-        month_str = month_names[(p['time_month']-1) % 12]
-
-        return jsonify({
-            "health": p["health"],
-            "money": p["money"],
-            "hunger": p["hunger"],
-            "energy": p["energy"],
-            "thirst": p["thirst"],
-            "alignment": p["alignment"],
-            "attack": p["attack"],
-            "defense": p["defense"],
-            "agility": p["agility"],
-            "location_name": p["location_name"],
-            "q": p["q"],
-            "r": p["r"],
-            "place_name": p["place_name"],
-
-            ### TIME FEATURE ADDED ###
-            "time_year": p["time_year"],
-            "time_month_str": month_str,
-            "time_day": p["time_day"],
-            "time_hour": p["time_hour"]
-        })
+        etag, body = _current_player_state()
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        resp = current_app.response_class(body, mimetype="application/json")
+        resp.set_etag(etag)
+        # Live state: a browser may keep a copy but must revalidate it every time
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
     except Exception as e:
         current_app.logger.exception("Error in get_player_state")
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}, 500)
 
 @app.route("/api/get_actions", methods=["GET"])
 def get_actions():
     try:
         # Now returns a dictionary of 3 lists directly
-        actions_dict = engine.get_possible_actions()
-        return jsonify(actions_dict)
+        return ojson(_current_actions())
     except Exception as e:
         current_app.logger.exception("Error in get_actions")
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}, 500)
+
+@app.route("/api/bootstrap", methods=["GET"])
+def bootstrap():
+    """
+    Player state and possible actions in one response, so the frontend needs a
+    single round trip per turn: {"state": <get_player_state>, "actions": <get_actions>}.
+    The state's cached JSON is spliced in as is.
+    """
+    try:
+        _, state_body = _current_player_state()
+        actions_body = _dumpb(_current_actions())
+        body = b'{"state":%s,"actions":%s}' % (state_body, actions_body)
+        resp = current_app.response_class(body, mimetype="application/json")
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    except Exception as e:
+        current_app.logger.exception("Error in bootstrap")
+        return ojson({"error": str(e)}, 500)
+
+@app.route("/api/get_actions_stream", methods=["GET"])
+def get_actions_stream():
+    """
+    Server-sent events: one `data: {"action": ...}` event per site action as the
+    model produces it, then an `event: done`. The other action categories are
+    cheap and still come from /api/get_actions.
+    """
+    def events():
+        try:
+            for action in engine.iter_site_actions():
+                yield f"data: {json.dumps({'action': action})}\n\n"
+        except Exception as e:
+            current_app.logger.exception("Error in get_actions_stream")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
 
 @app.route("/api/apply_action", methods=["POST"])
 def apply_action():
     try:
-        data = request.json
+        data = request.get_json(cache=True)
         chosen_action = data.get("action", "")
-        result = engine.apply_action(chosen_action)
-        return jsonify({"result": result})
+        try:
+            result = engine.apply_action(chosen_action)
+        finally:
+            _prefetch_after_action(_bump_state_version())
+        return ojson({"result": result})
     except Exception as e:
         current_app.logger.exception("Error in apply_action")
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}, 500)
 
 @app.route("/api/ask_question", methods=["POST"])
 def ask_question():
     try:
-        data = request.json
+        data = request.get_json(cache=True)
         question = data.get("question", "")
         answer = engine.answer_question(question)
-        return jsonify({"answer": answer})
+        return ojson({"answer": answer})
     except Exception as e:
         current_app.logger.exception("Error in ask_question")
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}, 500)
 
 @app.route("/api/map_data", methods=["GET"])
 def map_data():
+    """
+    Chunks inside ?qmin=&qmax=&rmin=&rmax= (any bound left out defaults to
+    _MAP_RADIUS chunks from the player), so a request costs O(viewport) rather
+    than O(explored world).
+    """
     try:
-        cursor = engine.db.cursor()
-        rows = cursor.execute("SELECT q, r, data_json FROM chunks").fetchall()
-        results = []
-        for row in rows:
-            try:
-                q = row[0]  # Using index instead of key
-                r = row[1]
-                chunk_json = json.loads(row[2])
-                results.append({
-                    "q": q,
-                    "r": r,
-                    "chunk_data": chunk_json
-                })
-            except Exception as e:
-                current_app.logger.error(f"Error processing row {row}: {e}")
-        return jsonify(results)
+        args = request.args
+        bounds = [args.get(k, type=int) for k in ("qmin", "qmax", "rmin", "rmax")]
+        if None in bounds:
+            p = engine.get_player_state()
+            defaults = (p["q"] - _MAP_RADIUS, p["q"] + _MAP_RADIUS,
+                        p["r"] - _MAP_RADIUS, p["r"] + _MAP_RADIUS)
+            bounds = [d if b is None else b for b, d in zip(bounds, defaults)]
+        bounds = tuple(bounds)
+
+        # The map only changes when chunks do; triggers on chunks bump
+        # map_version on every insert, update or delete, so bounds + version
+        # identify the body and polling with If-None-Match gets a 304 without
+        # reading the chunk data.
+        (version,) = engine.db.execute(_MAP_VERSION_SQL).fetchone()
+        etag = "{}_{}_{}_{}-{}".format(*bounds, version)
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+
+        def generate():
+            # data_json is already JSON, so it is spliced into the response as
+            # is (no parse + re-serialize). Rows are batched into ~64 KiB
+            # pieces so the server writes a few large chunks, not one per row.
+            cursor = engine.db.cursor()
+            cursor.row_factory = None  # plain tuples, unpacked directly below
+            buf = bytearray(b"[")
+            sep = b""
+            for q, r, data_json in cursor.execute(_MAP_SQL, bounds):
+                buf += b'%s{"q":%d,"r":%d,"chunk_data":%s}' % (sep, q, r, data_json.encode())
+                sep = b","
+                if len(buf) >= _MAP_BATCH_BYTES:
+                    yield bytes(buf)
+                    buf.clear()
+            buf += b"]"
+            yield bytes(buf)
+
+        resp = Response(stream_with_context(generate()), mimetype="application/json")
+        resp.set_etag(etag)
+        return resp
     except Exception as e:
-        current_app.logger.error(f"Error in map_data: {e}")
-        return jsonify([]), 500
+        current_app.logger.exception("Error in map_data")
+        return ojson([], 500)
+
+# WSGI deployment with gevent (one greenlet per request), run from web/ like
+# this script so game.db resolves to the same file:
+#   gunicorn -k gevent -w 1 -b 0.0.0.0:8000 server:app
+# Keep a single worker process: the player-state version, the prefetched
+# actions and the engine's chunk/NPC/AI caches live in this process, and a
+# second worker would keep serving its own stale copies of them.
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=8000, help='Port to run the server on')
+    parser.add_argument('--debug', action='store_true', help='Use the Flask development server (with reloader)')
     args = parser.parse_args()
-    app.run(debug=True, host="0.0.0.0", port=args.port)
+    if args.debug:
+        app.logger.warning("Running the Flask development server; use waitress or gunicorn (see above) to serve the game")
+        app.run(debug=True, host="0.0.0.0", port=args.port)
+    else:
+        from waitress import serve
+        # A single process with a pool of worker threads: each request runs on
+        # one of them, so a request waiting on Cohere doesn't hold up the others.
+        # Writes are serialized by engine.write_lock. One process because the
+        # engine keeps per-process caches (chunks, NPCs, AI replies) that
+        # separate worker processes would each hold stale copies of.
+        serve(app, host="0.0.0.0", port=args.port, threads=8)
@@ -51,12 +51,9 @@ document.addEventListener("DOMContentLoaded", () => {
         return `${day}${suffixes[day] || suffixes.default}`;
     }
 
-    // 1) Load player state
-    async function loadPlayerState() {
+    // 1) Show player state
+    function renderPlayerState(data) {
         try {
-            const res = await fetch("/api/get_player_state");
-            const data = await res.json();
-            
             // Update location and time info
             locationDisplay.textContent = `Location: ${data.location_name}`;
             coordinatesDisplay.textContent = `Coordinates: (${data.q},${data.r})`; // Removed space after comma to match regex
@@ -121,11 +118,9 @@ document.addEventListener("DOMContentLoaded", () => {
         actionButtons.appendChild(section);
     }
 
-    // 2) Load possible actions
-    async function loadActions() {
+    // 2) Show possible actions
+    function renderActions(data) {
         try {
-            const res = await fetch("/api/get_actions");
-            const data = await res.json();
             const { location_movement, site_movement, site_actions, follow_up_actions } = data;
 
             // Clear old buttons
@@ -200,8 +195,12 @@ document.addEventListener("DOMContentLoaded", () => {
     // Utility: refresh all UI elements
     async function refreshUI() {
         try {
-            await loadPlayerState();
-            await loadActions();
+            // State and actions arrive together from one request
+            const res = await fetch("/api/bootstrap");
+            const data = await res.json();
+            if (data.error) throw new Error(data.error);
+            renderPlayerState(data.state);
+            renderActions(data.actions);
             // Refresh map if it's visible
             if (document.getElementById('mapContainer').classList.contains('map-visible')) {
                 if (typeof refreshMap === 'function') {